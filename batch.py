@@ -0,0 +1,299 @@
+"""
+Batch - Processamento em lote de sprite sheets fora da interface gráfica
+Executa detecção e exportação em um pool de processos ou em etapas encadeadas, sem depender do Qt
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# Extensões de imagem procuradas nas pastas de entrada
+BATCH_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+# Total de pixels que podem estar em processamento ao mesmo tempo (~800 MB em BGRA);
+# arquivos são submetidos ao pool só quando cabem no orçamento
+DEFAULT_MAX_PENDING_PIXELS = 200_000_000
+
+# Marca de fim de fila entre as etapas de run_pipeline
+_STAGE_DONE = object()
+
+
+@dataclass
+class BatchParams:
+    """Parâmetros de detecção e exportação aplicados a cada sprite sheet"""
+    threshold: int = 10
+    min_area: int = 100
+    padding: int = 0
+    uniform_size: bool = False
+    prefix: str = "sprite"
+
+
+def find_images(input_dir, recursive: bool = True) -> List[Path]:
+    """Lista as imagens da pasta de entrada, em ordem de caminho"""
+    root = Path(input_dir)
+    paths = root.rglob("*") if recursive else root.glob("*")
+    return sorted(p for p in paths if p.is_file() and p.suffix.lower() in BATCH_EXTENSIONS)
+
+
+def image_pixels(path) -> int:
+    """Número de pixels da imagem lendo só o cabeçalho (0 se não for possível)"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.width * img.height
+    except Exception:
+        return 0
+
+
+def _new_result(path) -> dict:
+    return {"path": str(path), "status": "error", "sprites": 0, "outputs": [], "error": None}
+
+
+def _detect_sheet(extractor, params: BatchParams, result: dict) -> bool:
+    """Etapa de detecção; retorna True se há sprites a exportar"""
+    sprites = extractor.detect_sprites(threshold=params.threshold, min_area=params.min_area)
+    result["sprites"] = len(sprites)
+    if not sprites:
+        result["status"] = "empty"
+    return bool(sprites)
+
+
+def _export_sheet(extractor, path: Path, output_dir, params: BatchParams, result: dict):
+    """Etapa de codificação: grava os sprites em output_dir/<nome do arquivo>"""
+    # Subpasta por sprite sheet e prefixo com o nome do arquivo evitam colisões
+    exported = extractor.export_sprites(
+        output_dir=str(Path(output_dir) / path.stem),
+        prefix=f"{params.prefix}_{path.stem}",
+        padding=params.padding,
+        uniform_size=params.uniform_size
+    )
+    result["outputs"] = [str(p) for p in exported]
+    result["status"] = "ok"
+
+
+def process_sheet(path, output_dir, params: BatchParams) -> dict:
+    """
+    Detecta e exporta os sprites de um sprite sheet para output_dir/<nome do arquivo>
+
+    Executado nos processos do pool: recebe e devolve apenas objetos serializáveis.
+
+    Returns:
+        Dicionário com path, status ("ok", "empty" ou "error"), sprites, outputs,
+        error e seconds
+    """
+    from sprite_extractor import SpriteExtractor
+
+    start = time.perf_counter()
+    path = Path(path)
+    result = _new_result(path)
+    try:
+        extractor = SpriteExtractor()
+        if not extractor.load_image(str(path)):
+            result["error"] = "falha ao carregar a imagem"
+        elif _detect_sheet(extractor, params, result):
+            _export_sheet(extractor, path, output_dir, params, result)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_pipeline(files: Iterable, output_dir, params: Optional[BatchParams] = None,
+                 jobs: Optional[int] = None, queue_size: Optional[int] = None,
+                 on_result: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    Processa os arquivos em três etapas sobrepostas (leitura, detecção, codificação),
+    cada uma com `jobs` threads ligadas por filas limitadas.
+
+    As etapas usam OpenCV, que libera o GIL, então leitura de disco, detecção e
+    gravação de PNGs de arquivos diferentes acontecem ao mesmo tempo. As filas
+    limitam quantas imagens decodificadas esperam pela etapa seguinte.
+
+    Args:
+        on_result: Chamado (de uma thread de etapa) com o resultado de cada arquivo
+
+    Returns:
+        Resultados no formato de process_sheet, com o tempo de cada etapa em "stages",
+        na ordem dos arquivos
+    """
+    from sprite_extractor import SpriteExtractor
+
+    params = params or BatchParams()
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    queue_size = queue_size or 2 * jobs
+    paths: "queue.Queue" = queue.Queue()
+    for f in files:
+        paths.put(Path(f))
+    decoded: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    detected: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    results = {}
+    lock = threading.Lock()
+
+    def finish(path, result, start):
+        result["seconds"] = time.perf_counter() - start
+        with lock:
+            results[path] = result
+        if on_result is not None:
+            on_result(result)
+
+    def timed(result, stage, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            result["stages"][stage] = time.perf_counter() - t0
+
+    def decode_stage():
+        while True:
+            try:
+                path = paths.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            result = _new_result(path)
+            result["stages"] = {}
+            try:
+                extractor = SpriteExtractor()
+                if timed(result, "decode", extractor.load_image, str(path)):
+                    decoded.put((path, extractor, result, start))
+                    continue
+                result["error"] = "falha ao carregar a imagem"
+            except Exception as e:
+                result["error"] = str(e)
+            finish(path, result, start)
+
+    def detect_stage():
+        while True:
+            item = decoded.get()
+            if item is _STAGE_DONE:
+                return
+            path, extractor, result, start = item
+            try:
+                if timed(result, "detect", _detect_sheet, extractor, params, result):
+                    detected.put(item)
+                    continue
+            except Exception as e:
+                result["error"] = str(e)
+            finish(path, result, start)
+
+    def encode_stage():
+        while True:
+            item = detected.get()
+            if item is _STAGE_DONE:
+                return
+            path, extractor, result, start = item
+            try:
+                timed(result, "encode", _export_sheet, extractor, path, output_dir, params, result)
+            except Exception as e:
+                result["error"] = str(e)
+            finish(path, result, start)
+
+    # Todas as etapas rodam desde o início; cada uma termina quando a anterior
+    # acabou e sua fila de entrada foi esvaziada
+    stages = [(decode_stage, None), (detect_stage, decoded), (encode_stage, detected)]
+    workers = [[threading.Thread(target=target, daemon=True) for _ in range(jobs)] for target, _ in stages]
+    for thread in (t for threads in workers for t in threads):
+        thread.start()
+    for (_, inbox), threads, previous in zip(stages, workers, [[]] + workers):
+        for thread in previous:
+            thread.join()
+        if inbox is not None:
+            for _ in threads:
+                inbox.put(_STAGE_DONE)
+    for thread in workers[-1]:
+        thread.join()
+
+    return [results[path] for path in sorted(results)]
+
+
+def summarize(results: List[dict], **info) -> dict:
+    """Resumo do lote em formato JSON: totais, parâmetros (info) e resultado por arquivo"""
+    totals = {"files": len(results), "sprites": sum(r["sprites"] for r in results)}
+    for status in ("ok", "empty", "error"):
+        totals[status] = sum(1 for r in results if r["status"] == status)
+    return {**info, "totals": totals, "files": results}
+
+
+class BatchRunner:
+    """
+    Distribui sprite sheets entre processos e entrega os resultados conforme terminam.
+
+    Aplica contrapressão: no máximo 2 arquivos por processo ficam em andamento, e a
+    soma dos seus pixels não passa de max_pending_pixels (um arquivo sempre pode
+    entrar sozinho, por maior que seja). pause(), resume() e cancel() podem ser
+    chamados de outra thread enquanto run() é iterado.
+    """
+
+    def __init__(self, files: Iterable, output_dir, params: Optional[BatchParams] = None,
+                 jobs: Optional[int] = None, max_pending_pixels: int = DEFAULT_MAX_PENDING_PIXELS):
+        self.files = [Path(f) for f in files]
+        self.output_dir = Path(output_dir)
+        self.params = params or BatchParams()
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        self.max_pending_pixels = max_pending_pixels
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    def pause(self):
+        """Para de submeter arquivos; os que já estão em andamento terminam"""
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        """Descarta os arquivos ainda não iniciados; run() termina após os em andamento"""
+        self._cancelled.set()
+        self._running.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self) -> Iterator[dict]:
+        """Processa os arquivos, gerando o resultado de process_sheet de cada um ao terminar"""
+        pending = {} # future -> (arquivo, pixels)
+        pending_pixels = 0
+        next_file = 0
+        max_in_flight = 2 * self.jobs
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            while not self.cancelled and (next_file < len(self.files) or pending):
+                while (self._running.is_set() and not self.cancelled
+                       and next_file < len(self.files) and len(pending) < max_in_flight):
+                    path = self.files[next_file]
+                    pixels = image_pixels(path)
+                    if pending and pending_pixels + pixels > self.max_pending_pixels:
+                        break
+                    future = pool.submit(process_sheet, str(path), str(self.output_dir), self.params)
+                    pending[future] = (path, pixels)
+                    pending_pixels += pixels
+                    next_file += 1
+
+                if not pending:
+                    # Pausado sem nada em andamento: aguardar resume() ou cancel()
+                    self._running.wait(0.1)
+                    continue
+
+                done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, pixels = pending.pop(future)
+                    pending_pixels -= pixels
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        # Processo do pool encerrado de forma anormal
+                        yield {"path": str(path), "status": "error", "sprites": 0,
+                               "outputs": [], "error": str(e), "seconds": 0.0}
+
+            # Cancelado: os arquivos ainda na fila do pool não chegam a rodar
+            for future in pending:
+                future.cancel()
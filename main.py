@@ -7,12 +7,68 @@ Data: 2026-01-29
 import sys
 import argparse
 
-def main():
+
+def batch_main(argv) -> int:
+    """Subcomando `batch`: extração em lote sem interface gráfica (não importa o PyQt6)"""
+    import json
+    import time
+    from pathlib import Path
+    from batch import BatchParams, find_images, run_pipeline, summarize
+
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Extrai os sprites de todas as imagens de uma pasta, sem interface gráfica"
+    )
+    parser.add_argument("input", help="Pasta com os sprite sheets")
+    parser.add_argument("output", help="Pasta de saída (uma subpasta por sprite sheet)")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Threads por etapa (padrão: número de CPUs)")
+    parser.add_argument("--threshold", type=int, default=10, help="Sensibilidade da binarização (1-255)")
+    parser.add_argument("--min-area", type=int, default=100, help="Área mínima de um sprite (px²)")
+    parser.add_argument("--padding", type=int, default=0, help="Margem extra ao redor de cada sprite")
+    parser.add_argument("--uniform", action="store_true", help="Exportar todos os sprites de um sheet no mesmo tamanho")
+    parser.add_argument("--prefix", default="sprite", help="Prefixo dos arquivos exportados")
+    parser.add_argument("--no-recursive", action="store_true", help="Não buscar imagens em subpastas")
+    parser.add_argument("--summary", help="Caminho do resumo JSON (padrão: OUTPUT/batch_summary.json)")
+    args = parser.parse_args(argv)
+
+    if not Path(args.input).is_dir():
+        parser.error(f"pasta de entrada não encontrada: {args.input}")
+
+    params = BatchParams(threshold=args.threshold, min_area=args.min_area, padding=args.padding,
+                         uniform_size=args.uniform, prefix=args.prefix)
+    files = find_images(args.input, recursive=not args.no_recursive)
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    def report(result):
+        print(f"[{result['status']}] {result['path']}: {result['sprites']} sprites", flush=True)
+
+    start = time.perf_counter()
+    results = run_pipeline(files, output, params, jobs=args.jobs, on_result=report)
+    summary = summarize(results, input=str(args.input), output=str(output),
+                        params=vars(params), seconds=time.perf_counter() - start)
+
+    summary_path = Path(args.summary) if args.summary else output / "batch_summary.json"
+    summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+    totals = summary["totals"]
+    print(f"{totals['ok']}/{totals['files']} arquivos, {totals['sprites']} sprites; resumo em {summary_path}")
+    return 1 if totals["error"] else 0
+
+
+def main(argv=None):
     """Função principal"""
-    parser = argparse.ArgumentParser(description="Sprite Extractor - Extrator de Sprites")
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "batch":
+        sys.exit(batch_main(argv[1:]))
+
+    parser = argparse.ArgumentParser(
+        description="Sprite Extractor - Extrator de Sprites",
+        epilog="Para processar uma pasta sem interface gráfica: main.py batch ENTRADA SAIDA [--help]"
+    )
     parser.add_argument("path", nargs="?", help="Caminho para o sprite sheet")
     parser.add_argument("--version", action="version", version="Sprite Extractor 1.0.0")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Importar apenas se não for --version ou --help (que o argparse já resolveu)
     from PyQt6.QtWidgets import QApplication
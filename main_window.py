@@ -6,29 +6,84 @@ from PyQt6.QtWidgets import (
     QPushButton, QLabel, QSlider, QLineEdit, QFileDialog,
     QGraphicsView, QGraphicsScene, QListWidget, QListWidgetItem,
     QSpinBox, QMessageBox, QGroupBox, QFormLayout, QTabWidget,
-    QCheckBox, QComboBox
+    QCheckBox, QComboBox, QAbstractItemView, QApplication, QGraphicsRectItem,
+    QProgressBar
 )
-from PyQt6.QtCore import Qt, QRectF, QFileSystemWatcher, pyqtSignal
+from PyQt6.QtCore import Qt, QRectF, QFileSystemWatcher, QItemSelectionModel, QThread, pyqtSignal
 from PyQt6.QtGui import QPixmap, QImage, QPen, QColor, QKeySequence, QShortcut, QIcon
 from pathlib import Path
+import os
 import cv2
 import numpy as np
 
 from sprite_extractor import SpriteExtractor
+from spatial_index import SpatialIndex
+from batch import BatchParams, BatchRunner, find_images
 # from preview_3d import SpritePreview3D (Lazy loaded)
 
 
 class ClickableGraphicsView(QGraphicsView):
-    """QGraphicsView customizado que detecta cliques na imagem"""
+    """QGraphicsView customizado que detecta cliques, hover e seleção por área na imagem"""
     clicked = pyqtSignal(int, int) # Sinal que emite x, y
+    hovered = pyqtSignal(int, int) # Posição do mouse na cena (sem botões pressionados)
+    area_selected = pyqtSignal(int, int, int, int) # Retângulo arrastado: x0, y0, x1, y1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMouseTracking(True)
+        # Arrastar com o botão esquerdo desenha um retângulo de seleção
+        self.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
+        self._press_pos = None
 
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             # Obter coordenadas na cena
             scene_pos = self.mapToScene(event.pos())
+            self._press_pos = event.pos()
             self.clicked.emit(int(scene_pos.x()), int(scene_pos.y()))
         super().mousePressEvent(event)
 
+    def mouseMoveEvent(self, event):
+        if event.buttons() == Qt.MouseButton.NoButton:
+            scene_pos = self.mapToScene(event.pos())
+            self.hovered.emit(int(scene_pos.x()), int(scene_pos.y()))
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton and self._press_pos is not None:
+            drag = event.pos() - self._press_pos
+            if drag.manhattanLength() >= QApplication.startDragDistance():
+                start = self.mapToScene(self._press_pos)
+                end = self.mapToScene(event.pos())
+                self.area_selected.emit(int(start.x()), int(start.y()), int(end.x()), int(end.y()))
+            self._press_pos = None
+        super().mouseReleaseEvent(event)
+
+
+class ThresholdIndexBuilder(QThread):
+    """Constrói o índice de thresholds do extrator em segundo plano"""
+    built = pyqtSignal(object) # Emite o ThresholdIndex (ou None)
+
+    def __init__(self, extractor, parent=None):
+        super().__init__(parent)
+        self.extractor = extractor
+
+    def run(self):
+        self.built.emit(self.extractor.build_threshold_index())
+
+
+class BatchWorker(QThread):
+    """Itera um BatchRunner fora da thread da interface, emitindo cada resultado"""
+    file_done = pyqtSignal(object) # Dicionário de resultado de batch.process_sheet
+
+    def __init__(self, runner, parent=None):
+        super().__init__(parent)
+        self.runner = runner
+
+    def run(self):
+        for result in self.runner.run():
+            self.file_done.emit(result)
+
 
 class MainWindow(QMainWindow):
     """Janela principal da aplicação"""
@@ -37,6 +92,12 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.extractor = SpriteExtractor()
         self.selected_sprite_index = -1
+        self.selected_sprite_indices = set()
+        self.sprite_index = SpatialIndex([])
+        self._row_for_sprite = {} # sprite.index -> linha em sprites_list
+        self._hover_item = None
+        self._index_builders = set()
+        self.batch_worker = None
         self.watcher = QFileSystemWatcher()
         self.watcher.fileChanged.connect(self.on_file_updated)
         self.init_ui()
@@ -143,11 +204,19 @@ class MainWindow(QMainWindow):
         self.batch_recursive.setChecked(True)
         form_layout.addRow("", self.batch_recursive)
         
+        self.batch_jobs = QSpinBox()
+        self.batch_jobs.setRange(1, os.cpu_count() or 1)
+        self.batch_jobs.setValue(os.cpu_count() or 1)
+        self.batch_jobs.setToolTip("Número de processos trabalhando em paralelo")
+        form_layout.addRow("Processos:", self.batch_jobs)
+        
         layout.addWidget(form_group)
         
         # Log de progresso
         self.batch_log = QListWidget()
         layout.addWidget(QLabel("Progresso:"))
+        self.batch_progress = QProgressBar()
+        layout.addWidget(self.batch_progress)
         layout.addWidget(self.batch_log)
         
         # Botão Iniciar
@@ -158,6 +227,19 @@ class MainWindow(QMainWindow):
         self.start_batch_btn.clicked.connect(self.run_batch_processing)
         layout.addWidget(self.start_batch_btn)
         
+        # Pausar / Cancelar
+        batch_controls = QHBoxLayout()
+        self.pause_batch_btn = QPushButton("⏸ Pausar")
+        self.pause_batch_btn.setCheckable(True)
+        self.pause_batch_btn.setEnabled(False)
+        self.pause_batch_btn.toggled.connect(self.toggle_batch_pause)
+        batch_controls.addWidget(self.pause_batch_btn)
+        self.cancel_batch_btn = QPushButton("⏹ Cancelar")
+        self.cancel_batch_btn.setEnabled(False)
+        self.cancel_batch_btn.clicked.connect(self.cancel_batch_processing)
+        batch_controls.addWidget(self.cancel_batch_btn)
+        layout.addLayout(batch_controls)
+        
         return panel
 
     def select_batch_input(self):
@@ -175,76 +257,93 @@ class MainWindow(QMainWindow):
             self.batch_output_btn.setText(f"📁 {Path(path).name}")
 
     def run_batch_processing(self):
-        """Executa o processamento em lote"""
+        """Executa o processamento em lote em um pool de processos"""
         if not hasattr(self, 'batch_input_path') or not hasattr(self, 'batch_output_path'):
             QMessageBox.warning(self, "Aviso", "Selecione as pastas de entrada e saída.")
             return
 
-        input_path = Path(self.batch_input_path)
-        output_path = Path(self.batch_output_path)
-        prefix_base = self.batch_prefix.text() or "sprite"
         is_recursive = self.batch_recursive.isChecked()
-        
-        # Encontrar todas as imagens
-        extensions = ['*.png', '*.jpg', '*.jpeg', '*.webp', '*.bmp']
-        image_files = []
-        
-        glob_func = input_path.rglob if is_recursive else input_path.glob
-        for ext in extensions:
-            image_files.extend(list(glob_func(ext)))
+        image_files = find_images(self.batch_input_path, recursive=is_recursive)
         
         if not image_files:
             QMessageBox.information(self, "Info", f"Nenhuma imagem encontrada na pasta de entrada {' (incluindo subpastas)' if is_recursive else ''}.")
             return
-            
-        self.batch_log.clear()
-        self.batch_log.addItem(f"🚀 Iniciando processamento de {len(image_files)} arquivos...")
         
-        processed_count = 0
-        for img_file in image_files:
-            try:
-                # Criar um extrator temporário para o lote
-                temp_extractor = SpriteExtractor()
-                if temp_extractor.load_image(str(img_file)):
-                    # Usar valores atuais da UI para detecção
-                    threshold = self.threshold_slider.value()
-                    min_area = self.min_area_spinbox.value()
-                    
-                    sprites = temp_extractor.detect_sprites(threshold=threshold, min_area=min_area)
-                    
-                    if sprites:
-                        # Criar subpasta para este sprite sheet para manter organização
-                        sheet_name = img_file.stem
-                        sheet_output = output_path / sheet_name
-                        
-                        # Usar configurações de exportação da aba principal
-                        padding = self.padding_spin.value()
-                        uniform = self.uniform_check.isChecked()
-                        
-                        # Prefixo combina a base com o nome do arquivo original para evitar colisões
-                        final_prefix = f"{prefix_base}_{sheet_name}"
-                        
-                        temp_extractor.export_sprites(
-                            output_dir=str(sheet_output),
-                            prefix=final_prefix,
-                            padding=padding,
-                            uniform_size=uniform
-                        )
-                        processed_count += 1
-                        self.batch_log.addItem(f"✅ {img_file.name} -> {len(sprites)} sprites em /{sheet_name}")
-                    else:
-                        self.batch_log.addItem(f"⚠️ {img_file.name}: Nenhum sprite detectado")
-                else:
-                    self.batch_log.addItem(f"❌ Erro ao carregar: {img_file.name}")
-            except Exception as e:
-                self.batch_log.addItem(f"❌ Falha em {img_file.name}: {str(e)}")
-            
-            # Forçar atualização da UI
+        # Usar valores atuais da UI para detecção e exportação
+        params = BatchParams(
+            threshold=self.threshold_slider.value(),
+            min_area=self.min_area_spinbox.value(),
+            padding=self.padding_spin.value(),
+            uniform_size=self.uniform_size_check.isChecked(),
+            prefix=self.batch_prefix.text() or "sprite"
+        )
+        runner = BatchRunner(image_files, self.batch_output_path, params, jobs=self.batch_jobs.value())
+        
+        self.batch_log.clear()
+        self.batch_log.addItem(f"🚀 Iniciando processamento de {len(image_files)} arquivos com {runner.jobs} processos...")
+        self.batch_progress.setRange(0, len(image_files))
+        self.batch_progress.setValue(0)
+        self.batch_processed_count = 0
+        
+        self.batch_worker = BatchWorker(runner, self)
+        self.batch_worker.file_done.connect(self.on_batch_file_done)
+        self.batch_worker.finished.connect(self.on_batch_finished)
+        self._set_batch_running(True)
+        self.batch_worker.start()
+
+    def _set_batch_running(self, running: bool):
+        """Alterna os controles do lote entre parado e em execução"""
+        self.start_batch_btn.setEnabled(not running)
+        self.batch_jobs.setEnabled(not running)
+        self.pause_batch_btn.setEnabled(running)
+        self.cancel_batch_btn.setEnabled(running)
+        self.pause_batch_btn.setChecked(False)
+        self.pause_batch_btn.setText("⏸ Pausar")
+
+    def toggle_batch_pause(self, paused: bool):
+        """Pausa ou retoma o lote em andamento"""
+        if self.batch_worker is None:
+            return
+        if paused:
+            self.batch_worker.runner.pause()
+            self.pause_batch_btn.setText("▶ Retomar")
+            self.batch_log.addItem("⏸ Pausado (arquivos em andamento serão concluídos)")
+        else:
+            self.batch_worker.runner.resume()
+            self.pause_batch_btn.setText("⏸ Pausar")
+            self.batch_log.addItem("▶ Retomado")
+        self.batch_log.scrollToBottom()
+
+    def cancel_batch_processing(self):
+        """Cancela os arquivos ainda não iniciados"""
+        if self.batch_worker is not None:
+            self.batch_worker.runner.cancel()
+            self.cancel_batch_btn.setEnabled(False)
+            self.pause_batch_btn.setEnabled(False)
+            self.batch_log.addItem("⏹ Cancelando...")
             self.batch_log.scrollToBottom()
-            import PyQt6.QtCore as QtCore
-            QtCore.QCoreApplication.processEvents()
-            
-        QMessageBox.information(self, "Fim", f"Processamento concluído!\n{processed_count} arquivos processados com sucesso.")
+
+    def on_batch_file_done(self, result: dict):
+        """Registra o resultado de um arquivo do lote"""
+        name = Path(result["path"]).name
+        if result["status"] == "ok":
+            self.batch_processed_count += 1
+            sheet_name = Path(result["path"]).stem
+            self.batch_log.addItem(f"✅ {name} -> {result['sprites']} sprites em /{sheet_name}")
+        elif result["status"] == "empty":
+            self.batch_log.addItem(f"⚠️ {name}: Nenhum sprite detectado")
+        else:
+            self.batch_log.addItem(f"❌ Falha em {name}: {result['error']}")
+        self.batch_progress.setValue(self.batch_progress.value() + 1)
+        self.batch_log.scrollToBottom()
+
+    def on_batch_finished(self):
+        """Finaliza o lote e reabilita os controles"""
+        cancelled = self.batch_worker.runner.cancelled
+        self.batch_worker = None
+        self._set_batch_running(False)
+        status = "cancelado" if cancelled else "concluído"
+        QMessageBox.information(self, "Fim", f"Processamento {status}!\n{self.batch_processed_count} arquivos processados com sucesso.")
 
     def _create_view_panel(self) -> QWidget:
         """Cria o painel de visualização da imagem"""
@@ -263,6 +362,8 @@ class MainWindow(QMainWindow):
         self.graphics_view.setScene(self.graphics_scene)
         self.graphics_view.setMinimumSize(600, 500)
         self.graphics_view.clicked.connect(self.on_image_clicked)
+        self.graphics_view.hovered.connect(self.on_image_hovered)
+        self.graphics_view.area_selected.connect(self.on_area_selected)
         layout.addWidget(self.graphics_view)
         
         return panel
@@ -358,6 +459,7 @@ class MainWindow(QMainWindow):
         
         self.sprites_list = QListWidget()
         self.sprites_list.setMaximumHeight(200)
+        self.sprites_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.sprites_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.sprites_list.customContextMenuRequested.connect(self.show_context_menu)
         self.sprites_list.itemSelectionChanged.connect(self.on_sprite_selected)
@@ -491,13 +593,39 @@ class MainWindow(QMainWindow):
                 self.detect_btn.setEnabled(True)
                 # Auto-detectar sprites
                 self.detect_sprites()
+                self.build_threshold_index()
             else:
                 QMessageBox.critical(self, "Erro", "Falha ao carregar a imagem")
 
+    def build_threshold_index(self):
+        """Inicia a construção do índice de thresholds para o slider em tempo real"""
+        builder = ThresholdIndexBuilder(self.extractor, self)
+        builder.built.connect(self.on_threshold_index_built)
+        # Manter referência até terminar; resultados de imagens antigas são ignorados
+        self._index_builders.add(builder)
+        builder.finished.connect(lambda: self._index_builders.discard(builder))
+        builder.start()
+
+    def on_threshold_index_built(self, index):
+        """Instala o índice construído (o extrator ignora índices de outra imagem)"""
+        self.extractor.set_threshold_index(index)
+
+    def closeEvent(self, event):
+        """Aguarda threads de segundo plano antes de fechar"""
+        for builder in list(self._index_builders):
+            builder.wait()
+        if self.batch_worker is not None:
+            # Interromper o lote: os arquivos em andamento terminam, os demais são descartados
+            self.batch_worker.finished.disconnect(self.on_batch_finished)
+            self.batch_worker.runner.cancel()
+            self.batch_worker.wait()
+        super().closeEvent(event)
+
     def on_file_updated(self, path):
         """Callback quando o arquivo vigiado é alterado externamente"""
         if self.extractor.load_image(path):
             self.detect_sprites()
+            self.build_threshold_index()
             # Se estiver na aba 3D, atualizar
             if self.tabs.currentIndex() == 2:
                 self.sync_3d_preview()
@@ -509,7 +637,8 @@ class MainWindow(QMainWindow):
                 # Mostrar a máscara binária processada
                 image = self.extractor.get_binary_mask_preview()
             else:
-                image = self.extractor.get_preview_image(draw_boxes=show_boxes, selected_index=self.selected_sprite_index)
+                image = self.extractor.get_preview_image(draw_boxes=show_boxes, selected_index=self.selected_sprite_index,
+                                                         selected_indices=self.selected_sprite_indices)
             
             if image is None:
                 return
@@ -532,12 +661,16 @@ class MainWindow(QMainWindow):
             
             pixmap = QPixmap.fromImage(q_image)
             self.graphics_scene.clear()
+            self._hover_item = None
             self.graphics_scene.addPixmap(pixmap)
             self.graphics_view.fitInView(self.graphics_scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
     
     def on_threshold_changed(self, value):
         """Callback quando o threshold muda"""
         self.threshold_value_label.setText(str(value))
+        # Com o índice pronto, a detecção é instantânea: atualizar ao arrastar
+        if self.extractor.has_threshold_index():
+            self.detect_sprites()
     
     def on_detection_params_changed(self):
         """Callback quando parâmetros de detecção mudam"""
@@ -548,6 +681,7 @@ class MainWindow(QMainWindow):
     def detect_sprites(self):
         """Detecta sprites na imagem"""
         self.selected_sprite_index = -1
+        self.selected_sprite_indices = set()
         if hasattr(self, 'edit_group'):
             self.edit_group.setEnabled(False)
             
@@ -568,6 +702,7 @@ class MainWindow(QMainWindow):
         elif "2x2" in layout_text: layout_hint = "2x2"
 
         sprites = self.extractor.detect_sprites(threshold=threshold, min_area=min_area, layout_hint=layout_hint)
+        self.sprite_index = SpatialIndex.from_sprites(sprites)
         
         # Restaurar vistas se os índices coincidirem (heurística simples)
         # Em uma implementação real, usaríamos a posição (x,y) para mapear
@@ -581,9 +716,12 @@ class MainWindow(QMainWindow):
 
     def update_sprite_list(self):
         """Atualiza a lista de sprites na UI"""
+        # Sem sinais durante a reconstrução, para não perder a seleção atual
+        self.sprites_list.blockSignals(True)
         self.sprites_list.clear()
+        self._row_for_sprite = {}
         selected_item = None
-        for sprite in self.extractor.sprites:
+        for row, sprite in enumerate(self.extractor.sprites):
             x, y, w, h = sprite.bbox
             
             # Formatar nome da vista para o usuário
@@ -595,13 +733,18 @@ class MainWindow(QMainWindow):
             item = QListWidgetItem(f"{view_name}{rot_label} - {w}x{h}px")
             item.setData(Qt.ItemDataRole.UserRole, sprite.index)
             self.sprites_list.addItem(item)
+            self._row_for_sprite[sprite.index] = row
             if sprite.index == self.selected_sprite_index:
                 selected_item = item
         
         if selected_item:
-            self.sprites_list.blockSignals(True)
             self.sprites_list.setCurrentItem(selected_item)
-            self.sprites_list.blockSignals(False)
+        # Restaurar a seleção múltipla
+        for index in self.selected_sprite_indices:
+            row = self._row_for_sprite.get(index)
+            if row is not None:
+                self.sprites_list.item(row).setSelected(True)
+        self.sprites_list.blockSignals(False)
 
     def show_context_menu(self, position):
         """Mostra menu de contexto para renomear vistas"""
@@ -680,10 +823,13 @@ class MainWindow(QMainWindow):
             self.set_sprite_view(index, text.lower().replace(" ", "_"))
 
     def on_sprite_selected(self):
-        """Callback quando um sprite é selecionado na lista"""
+        """Callback quando a seleção da lista muda"""
         selected_items = self.sprites_list.selectedItems()
+        self.selected_sprite_indices = {item.data(Qt.ItemDataRole.UserRole) for item in selected_items}
         if selected_items:
-            item = selected_items[0]
+            # O item corrente (último clicado) é o sprite em destaque
+            current = self.sprites_list.currentItem()
+            item = current if current in selected_items else selected_items[0]
             self.selected_sprite_index = item.data(Qt.ItemDataRole.UserRole)
             self.edit_group.setEnabled(True)
         else:
@@ -692,43 +838,78 @@ class MainWindow(QMainWindow):
         
         self.display_image(show_boxes=True)
 
+    def _selected_sprites(self):
+        """Sprites selecionados (todos, em seleção múltipla)"""
+        indices = self.selected_sprite_indices or {self.selected_sprite_index}
+        return [s for s in (self.extractor.get_sprite(i) for i in sorted(indices)) if s]
+
     def rotate_selected_sprite(self, angle):
-        """Rotaciona o sprite selecionado"""
-        if self.selected_sprite_index != -1:
-            sprite = self.extractor.get_sprite(self.selected_sprite_index)
-            if sprite:
-                sprite.rotation = angle
-                self.update_sprite_list()
-                self.sync_3d_preview()
+        """Rotaciona os sprites selecionados"""
+        sprites = self._selected_sprites()
+        for sprite in sprites:
+            sprite.rotation = angle
+        if sprites:
+            self.update_sprite_list()
+            self.sync_3d_preview()
 
     def set_selected_sprite_view(self, view_type):
-        """Define o tipo de vista para o sprite selecionado"""
-        if self.selected_sprite_index != -1:
-            self.set_sprite_view(self.selected_sprite_index, view_type)
+        """Define o tipo de vista para os sprites selecionados"""
+        sprites = self._selected_sprites()
+        for sprite in sprites:
+            sprite.view_type = view_type
+        if sprites:
+            self.update_sprite_list()
+            self.sync_3d_preview()
     
     def on_image_clicked(self, x, y):
         """Callback quando a imagem é clicada"""
         # Procurar qual sprite contém as coordenadas (x, y)
-        found_index = -1
-        for sprite in self.extractor.sprites:
-            sx, sy, sw, sh = sprite.bbox
-            if sx <= x <= sx + sw and sy <= y <= sy + sh:
-                found_index = sprite.index
-                break
-        
-        if found_index != -1:
+        hits = self.sprite_index.query_point(x, y)
+        row = self._row_for_sprite.get(hits[0]) if hits else None
+        
+        if row is not None:
             # Selecionar na lista (isso disparará on_sprite_selected)
-            for i in range(self.sprites_list.count()):
-                item = self.sprites_list.item(i)
-                if item.data(Qt.ItemDataRole.UserRole) == found_index:
-                    self.sprites_list.setCurrentItem(item)
-                    break
+            self.sprites_list.setCurrentRow(row)
         else:
             # Limpar seleção se clicar fora
             self.sprites_list.clearSelection()
             self.selected_sprite_index = -1
+            self.selected_sprite_indices = set()
             self.edit_group.setEnabled(False)
             self.display_image(show_boxes=True)
+
+    def on_area_selected(self, x0, y0, x1, y1):
+        """Seleciona todos os sprites que intersectam o retângulo arrastado"""
+        rows = [self._row_for_sprite[i] for i in self.sprite_index.query_rect(x0, y0, x1, y1)
+                if i in self._row_for_sprite]
+        self.sprites_list.blockSignals(True)
+        self.sprites_list.clearSelection()
+        for row in rows:
+            self.sprites_list.item(row).setSelected(True)
+        if rows:
+            self.sprites_list.setCurrentRow(rows[0], QItemSelectionModel.SelectionFlag.NoUpdate)
+        self.sprites_list.blockSignals(False)
+        self.on_sprite_selected()
+
+    def on_image_hovered(self, x, y):
+        """Destaca o sprite sob o cursor"""
+        hits = self.sprite_index.query_point(x, y)
+        sprite = self.extractor.get_sprite(hits[0]) if hits else None
+        if sprite is None:
+            if self._hover_item is not None:
+                self._hover_item.hide()
+            return
+        
+        sx, sy, sw, sh = sprite.bbox
+        if self._hover_item is None:
+            self._hover_item = QGraphicsRectItem()
+            pen = QPen(QColor(255, 200, 0), 2, Qt.PenStyle.DashLine)
+            pen.setCosmetic(True)
+            self._hover_item.setPen(pen)
+            self._hover_item.setZValue(10)
+            self.graphics_scene.addItem(self._hover_item)
+        self._hover_item.setRect(QRectF(sx, sy, sw, sh))
+        self._hover_item.show()
     
     def export_sprites(self):
         """Exporta sprites para arquivos individuais"""
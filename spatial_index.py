@@ -0,0 +1,89 @@
+"""
+Spatial Index - Índice espacial dos sprites detectados
+Grade uniforme para consultas de ponto e retângulo (clique, hover e seleção por área)
+"""
+import numpy as np
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class SpatialIndex:
+    """Grade uniforme sobre bounding boxes (x, y, largura, altura)"""
+
+    def __init__(self, bboxes: Iterable[Tuple[int, int, int, int]], ids: Optional[Iterable[int]] = None,
+                 cell_size: Optional[int] = None):
+        """
+        Args:
+            bboxes: Bounding boxes (x, y, largura, altura)
+            ids: Identificador de cada bbox (por padrão, a posição na lista)
+            cell_size: Lado das células da grade; por padrão, a mediana do maior
+                lado dos bboxes, para que cada bbox ocupe poucas células
+        """
+        self.boxes = np.array(list(bboxes), dtype=np.int64).reshape(-1, 4)
+        n = len(self.boxes)
+        self.ids = np.arange(n) if ids is None else np.array(list(ids), dtype=np.int64)
+        # Extremos inclusivos, como o teste de clique original (sx <= x <= sx + sw)
+        self.x0, self.y0 = self.boxes[:, 0], self.boxes[:, 1]
+        self.x1 = self.x0 + self.boxes[:, 2]
+        self.y1 = self.y0 + self.boxes[:, 3]
+
+        if cell_size is None:
+            cell_size = int(np.median(self.boxes[:, 2:].max(axis=1))) if n else 1
+        self.cell_size = max(int(cell_size), 16)
+
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        cs = self.cell_size
+        for i, (x0, y0, x1, y1) in enumerate(zip((self.x0 // cs).tolist(), (self.y0 // cs).tolist(),
+                                                  (self.x1 // cs).tolist(), (self.y1 // cs).tolist())):
+            for cy in range(y0, y1 + 1):
+                for cx in range(x0, x1 + 1):
+                    self._cells[(cx, cy)].append(i)
+
+    @classmethod
+    def from_sprites(cls, sprites) -> "SpatialIndex":
+        """Cria o índice usando sprite.index como identificador"""
+        return cls([s.bbox for s in sprites], [s.index for s in sprites])
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def query_point(self, x: float, y: float) -> List[int]:
+        """Ids cujos bboxes contêm o ponto, em ordem crescente"""
+        candidates = self._cells.get((int(x // self.cell_size), int(y // self.cell_size)))
+        if not candidates:
+            return []
+        rows = np.array(candidates)
+        hit = ((self.x0[rows] <= x) & (x <= self.x1[rows]) &
+               (self.y0[rows] <= y) & (y <= self.y1[rows]))
+        return sorted(self.ids[rows[hit]].tolist())
+
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float, contained: bool = False) -> List[int]:
+        """
+        Ids cujos bboxes intersectam o retângulo (ou estão inteiramente dentro dele,
+        se contained=True), em ordem crescente
+        """
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        cs = self.cell_size
+        cx0, cx1 = int(x0 // cs), int(x1 // cs)
+        cy0, cy1 = int(y0 // cs), int(y1 // cs)
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) >= len(self._cells):
+            # Retângulo grande: mais barato testar todos os bboxes de uma vez
+            rows = np.arange(len(self.boxes))
+        else:
+            found = set()
+            for cy in range(cy0, cy1 + 1):
+                for cx in range(cx0, cx1 + 1):
+                    found.update(self._cells.get((cx, cy), ()))
+            rows = np.array(sorted(found), dtype=np.int64)
+        if len(rows) == 0:
+            return []
+
+        if contained:
+            hit = ((x0 <= self.x0[rows]) & (self.x1[rows] <= x1) &
+                   (y0 <= self.y0[rows]) & (self.y1[rows] <= y1))
+        else:
+            hit = ((self.x0[rows] <= x1) & (x0 <= self.x1[rows]) &
+                   (self.y0[rows] <= y1) & (y0 <= self.y1[rows]))
+        return sorted(self.ids[rows[hit]].tolist())
@@ -5,8 +5,23 @@ Detecta e extrai sprites individuais de uma sprite sheet
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, List, Set, Tuple, Optional
 from dataclasses import dataclass
+from collections import OrderedDict
+
+
+# Motores de detecção disponíveis em SpriteExtractor.detect_sprites
+DETECTION_ENGINES = ("contours", "components")
+
+# Colunas do array de estatísticas de componentes
+STAT_X, STAT_Y, STAT_W, STAT_H, STAT_AREA, STAT_CX, STAT_CY, STAT_LABEL = range(8)
+
+# Margem (linhas) ao redor de cada faixa na detecção em faixas; deve cobrir o
+# alcance da limpeza morfológica (abertura + 2 erosões + 1 dilatação = 5 px)
+STRIP_HALO = 8
+
+# Orçamento padrão do cache de etapas da detecção (bytes)
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
 
 
 @dataclass
@@ -19,14 +34,191 @@ class Sprite:
     rotation: int = 0  # 0, 90, 180, 270 (sentido horário)
 
 
+class _StageCache:
+    """
+    Cache LRU dos resultados intermediários do pipeline de detecção.
+    Limitado pelo total de bytes dos arrays guardados; é esvaziado quando a imagem muda.
+    """
+    
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict() # chave -> (valor, bytes)
+        self._bytes = 0
+        self._source = None
+    
+    def bind(self, image: np.ndarray):
+        """Associa o cache à imagem de origem, descartando resultados de outra imagem"""
+        if image is not self._source:
+            self.clear()
+            self._source = image
+    
+    def get_or_compute(self, key: tuple, compute):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        value = compute()
+        size = _nbytes(value)
+        self._entries[key] = (value, size)
+        self._bytes += size
+        # Despejar as entradas menos usadas recentemente (mantendo a recém-calculada)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+        return value
+    
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._source = None
+
+
+def _nbytes(value) -> int:
+    """Tamanho aproximado em bytes dos arrays contidos em um resultado de etapa"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+class _UnionFind:
+    """Union-find simples para unir rótulos de componentes entre faixas"""
+    
+    def __init__(self):
+        self.parent: List[int] = []
+    
+    def add(self, count: int) -> int:
+        """Adiciona `count` elementos e retorna o id do primeiro"""
+        start = len(self.parent)
+        self.parent.extend(range(start, start + count))
+        return start
+    
+    def find(self, i: int) -> int:
+        parent = self.parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+    
+    def union_pairs(self, pairs: np.ndarray):
+        for a, b in pairs.tolist():
+            ra, rb = self.find(a), self.find(b)
+            if ra != rb:
+                self.parent[max(ra, rb)] = min(ra, rb)
+    
+    def roots(self) -> np.ndarray:
+        return np.array([self.find(i) for i in range(len(self.parent))], dtype=np.int64)
+
+
+def _boundary_pairs(prev_row: np.ndarray, row: np.ndarray, diagonal: bool) -> np.ndarray:
+    """
+    Pares únicos de ids globais que se tocam entre a última linha de uma faixa e a
+    primeira da seguinte (com diagonais para conectividade 8)
+    """
+    shifts = (-1, 0, 1) if diagonal else (0,)
+    pairs = []
+    for d in shifts:
+        a = prev_row[max(-d, 0):len(prev_row) - max(d, 0)]
+        b = row[max(d, 0):len(row) - max(-d, 0)]
+        mask = (a >= 0) & (b >= 0)
+        pairs.append(np.stack([a[mask], b[mask]], axis=1))
+    pairs = np.concatenate(pairs)
+    return np.unique(pairs, axis=0) if len(pairs) else pairs
+
+
+class ThresholdIndex:
+    """
+    Árvore de componentes por nível de cinza, achatada por threshold.
+
+    Guarda, para cada threshold de 1 a 255, as estatísticas (N, 8) dos componentes
+    que detect_sprites encontraria com o motor do índice. A morfologia usa elementos planos, que
+    comutam com o threshold: binarizar a imagem de níveis já limpa equivale a limpar
+    cada máscara binária, então cada nível é exato e a consulta é só um filtro
+    vetorizado. Não há mapa de rótulos (STAT_LABEL é -1).
+    """
+    
+    def __init__(self, source: np.ndarray, engine: str, levels: np.ndarray, offset: int,
+                 level_stats: List[np.ndarray]):
+        self.source = source # Imagem para a qual o índice foi construído
+        self.engine = engine # Motor cujas estatísticas o índice reproduz
+        self.levels = levels # Imagem de níveis limpa, sem a moldura zerada
+        self.offset = offset # Pixel é primeiro plano em T se levels >= T + offset
+        self.level_stats = level_stats # level_stats[T - 1] -> estatísticas (N, 8)
+    
+    @classmethod
+    def build(cls, image: np.ndarray, mode: str, engine: str = "contours",
+              progress: Optional[Callable[[int, int], None]] = None) -> "ThresholdIndex":
+        gray = SpriteExtractor._to_gray(image)
+        if mode == "light":
+            # Fundo claro: primeiro plano em T é gray <= 255 - T, isto é 255 - gray >= T
+            levels, offset = cv2.bitwise_not(gray), 0
+        else:
+            # Fundo escuro: primeiro plano em T é gray > T, isto é gray >= T + 1
+            levels, offset = gray.copy(), 1
+        levels = SpriteExtractor._clean_mask(levels)
+        
+        base = levels.copy()
+        SpriteExtractor._clear_border(base, 0, base.shape[0])
+        # Um nível sem pixels de valor exatamente L - 1 tem a mesma máscara do anterior
+        histogram = np.bincount(base.ravel(), minlength=256)
+        level_stats = []
+        for threshold in range(1, 256):
+            level = threshold + offset
+            if level_stats and (level > 256 or histogram[level - 1] == 0):
+                level_stats.append(level_stats[-1])
+            else:
+                _, binary = cv2.threshold(base, level - 1, 255, cv2.THRESH_BINARY)
+                stats, _ = SpriteExtractor._component_stats(binary, engine)
+                # Sem mapa de rótulos guardado por nível
+                stats[:, STAT_LABEL] = -1
+                level_stats.append(stats)
+            if progress:
+                progress(threshold, 255)
+        return cls(image, engine, levels, offset, level_stats)
+    
+    def components(self, threshold: int, min_area: int = 0) -> np.ndarray:
+        """Componentes no threshold dado com área >= min_area (sem ordenação)"""
+        stats = self.level_stats[min(max(int(threshold), 1), 255) - 1]
+        return stats[stats[:, STAT_AREA] >= min_area]
+    
+    def mask(self, threshold: int) -> np.ndarray:
+        """Máscara binária limpa (antes de zerar a moldura) no threshold dado"""
+        _, binary = cv2.threshold(self.levels, threshold + self.offset - 1, 255, cv2.THRESH_BINARY)
+        return binary
+
+
+def _cluster_positions(positions: np.ndarray, tolerance: float) -> Tuple[np.ndarray, int]:
+    """
+    Agrupa posições 1-D ordenando e quebrando nos saltos maiores que a tolerância.
+
+    Returns:
+        (índice do grupo de cada posição, em ordem crescente de posição; número de grupos)
+    """
+    if len(positions) == 0:
+        return (np.empty(0, dtype=np.int64), 0)
+    order = np.argsort(positions, kind="stable")
+    gaps = np.diff(positions[order]) > max(tolerance, 1)
+    sorted_groups = np.concatenate(([0], np.cumsum(gaps)))
+    groups = np.empty(len(positions), dtype=np.int64)
+    groups[order] = sorted_groups
+    return (groups, int(sorted_groups[-1]) + 1)
+
+
 class SpriteExtractor:
     """Classe principal para detecção e extração de sprites"""
     
-    def __init__(self):
+    def __init__(self, cache_bytes: int = DEFAULT_CACHE_BYTES):
         self.original_image: Optional[np.ndarray] = None
         self.sprites: List[Sprite] = []
         self.image_path: Optional[Path] = None
         self._last_binary_mask: Optional[np.ndarray] = None
+        self._last_labels: Optional[np.ndarray] = None
+        self._last_component_stats: Optional[np.ndarray] = None
+        self._stage_cache = _StageCache(cache_bytes)
+        self._threshold_index: Optional[ThresholdIndex] = None
+        self._mask_threshold: Optional[int] = None
         
     def load_image(self, path: str) -> bool:
         """
@@ -39,9 +231,15 @@ class SpriteExtractor:
             True se carregada com sucesso, False caso contrário
         """
         try:
+            self._threshold_index = None
             self.image_path = Path(path)
-            # Carrega com canal alpha se disponível
-            self.original_image = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+            if self.image_path.suffix.lower() == ".npy":
+                # Array BGR(A) salvo com np.save: mapeado em memória, sem carregar a
+                # imagem inteira (ver detect_sprites_tiled)
+                self.original_image = np.load(str(path), mmap_mode="r")
+            else:
+                # Carrega com canal alpha se disponível
+                self.original_image = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
             
             if self.original_image is None:
                 return False
@@ -51,60 +249,410 @@ class SpriteExtractor:
             print(f"Erro ao carregar imagem: {e}")
             return False
     
-    def detect_sprites(self, threshold: int = 10, min_area: int = 100, layout_hint: str = None) -> List[Sprite]:
+    def detect_sprites(self, threshold: int = 10, min_area: int = 100, layout_hint: str = None,
+                       engine: str = "contours") -> List[Sprite]:
         """
         Detecta sprites individuais na imagem
+
+        Args:
+            threshold: Sensibilidade da binarização (1-255)
+            min_area: Área mínima (px²) para um componente virar sprite. No motor
+                "contours" é a área do polígono do contorno (cv2.contourArea); no motor
+                "components" é a contagem de pixels da região com buracos preenchidos,
+                um pouco maior para o mesmo sprite
+            layout_hint: Layout conhecido ("3x2", "2x3", "2x2") ou None para automático
+            engine: Motor de detecção - "contours" (cv2.findContours) ou
+                "components" (rotulação por componentes conexos, vetorizada)
         """
+        if engine not in DETECTION_ENGINES:
+            raise ValueError(f"Motor de detecção desconhecido: {engine}")
+
         if self.original_image is None:
             return []
         
-        self.sprites = []
-        image = self.original_image.copy()
-        
-        # Converter para escala de cinza se a imagem tiver 3 canais (BGR)
-        if len(image.shape) == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Pipeline em etapas memoizadas: cada etapa só é recalculada quando os
+        # parâmetros dos quais depende mudam (ex.: min_area só refiltra as estatísticas)
+        cache = self._stage_cache
+        cache.bind(self.original_image)
+        image = cache.get_or_compute(("image",), self.original_image.copy)
+        index = self._threshold_index
+        if index is not None and index.engine == engine and index.source is self.original_image:
+            # Índice pré-calculado: componentes sem tocar nos pixels novamente
+            stats = cache.get_or_compute(("components", threshold, engine),
+                                         lambda: index.components(threshold))
+            self._last_binary_mask = None
+            self._last_labels = None
+            self._mask_threshold = threshold
         else:
-            gray = image # Já é grayscale ou tem 1 canal
+            mode = cache.get_or_compute(("mode",), lambda: self._binarization_mode(image))
+            mask = cache.get_or_compute(("mask", threshold),
+                                        lambda: self._binarize(image, mode, threshold))
+            self._last_binary_mask = mask # Preview no UI (somente leitura)
+            self._mask_threshold = None
+            stats, self._last_labels = cache.get_or_compute(
+                ("components", threshold, engine), lambda: self._find_components(mask, engine))
+        selected = cache.get_or_compute(("filter", threshold, engine, min_area),
+                                        lambda: self._filter_and_sort(stats, min_area))
+        
+        return self._build_sprites(image, selected, layout_hint)
+
+    def build_threshold_index(self, engine: str = "contours",
+                              progress: Optional[Callable[[int, int], None]] = None) -> Optional["ThresholdIndex"]:
+        """
+        Pré-calcula o índice de componentes por threshold da imagem atual.
+
+        Depois de instalado (set_threshold_index), detect_sprites com o mesmo
+        motor responde a qualquer threshold de 1 a 255 a partir do índice, sem
+        binarização, morfologia ou busca de componentes. Não se aplica quando a detecção usa o canal
+        alpha (o threshold não tem efeito); nesse caso retorna None.
+        Pode rodar em outra thread: apenas lê original_image.
+
+        Args:
+            engine: Motor cujos resultados o índice deve reproduzir
+            progress: Callback opcional (nível atual, total de níveis)
+        """
+        image = self.original_image
+        if image is None:
+            return None
+        mode = self._binarization_mode(image)
+        if mode == "alpha":
+            return None
+        if engine not in DETECTION_ENGINES:
+            raise ValueError(f"Motor de detecção desconhecido: {engine}")
+        return ThresholdIndex.build(image, mode, engine, progress)
+
+    def set_threshold_index(self, index: Optional["ThresholdIndex"]):
+        """Instala um índice construído por build_threshold_index (ignorado se for de outra imagem)"""
+        if index is None or index.source is self.original_image:
+            self._threshold_index = index
+            self._stage_cache.clear()
+
+    def has_threshold_index(self) -> bool:
+        """True se há um índice de thresholds válido para a imagem atual"""
+        index = self._threshold_index
+        return index is not None and index.source is self.original_image
+
+    def clear_cache(self):
+        """Descarta todos os resultados intermediários memoizados"""
+        self._stage_cache.clear()
+
+    def detect_sprites_tiled(self, threshold: int = 10, min_area: int = 100, layout_hint: str = None,
+                             strip_height: int = 1024) -> List[Sprite]:
+        """
+        Detecta sprites processando a imagem em faixas horizontais (out-of-core)
+
+        Equivale a detect_sprites(engine="components"), mas nunca cria buffers
+        intermediários (cinza, máscara, rótulos) do tamanho da imagem: cada faixa é
+        binarizada com uma margem de STRIP_HALO linhas para que a morfologia seja
+        exata, e componentes que cruzam faixas são unidos por union-find. Com uma
+        imagem mapeada em memória (.npy, ver load_image) o pico de memória é
+        limitado pela altura da faixa. Os sprites são views da imagem original.
+
+        Args:
+            threshold: Sensibilidade da binarização (1-255)
+            min_area: Área mínima em pixels (buracos preenchidos, como no motor "components")
+            layout_hint: Layout conhecido ("3x2", "2x3", "2x2") ou None para automático
+            strip_height: Altura de cada faixa em pixels
+        """
+        if self.original_image is None:
+            return []
         
-        # Se a imagem tiver canal alpha, verificar se é útil (não totalmente sólido)
-        has_useful_alpha = False
-        if self.original_image.shape[2] == 4: # BGRA
-            alpha_channel = self.original_image[:, :, 3]
-            # Se houver qualquer pixel transparente (alpha < 255), consideramos o alpha útil
-            if not np.all(alpha_channel == 255):
-                has_useful_alpha = True
-                # Binarizar o canal alpha: pixels com alguma opacidade são considerados parte do sprite
-                _, binary = cv2.threshold(alpha_channel, 0, 255, cv2.THRESH_BINARY)
-        
-        if not has_useful_alpha:
-            # Caso contrário, usar thresholding na imagem em escala de cinza
-            # Detectar se o fundo é claro ou escuro baseando-se nos cantos
-            # Amostrar pequenas áreas nos cantos, com uma margem para ignorar molduras
-            h, w = gray.shape
-            margin_h = min(20, h // 50)
-            margin_w = min(20, w // 50)
-            corner_size = 10
+        image = self.original_image
+        strip_height = max(int(strip_height), 1)
+        mode = self._binarization_mode(image, strip_height)
+        
+        # Passo 1: fundo 4-conexo, para saber quais regiões de fundo são buracos
+        background = _UnionFind()
+        offsets = []
+        prev_row = None
+        outside = None
+        for y0, binary in self._iter_strip_masks(image, mode, threshold, strip_height):
+            num_labels, labels = cv2.connectedComponents(cv2.bitwise_not(binary), connectivity=4,
+                                                         ltype=cv2.CV_32S)
+            offset = background.add(num_labels - 1) - 1
+            offsets.append(offset)
+            if outside is None:
+                # A moldura zerada garante que (0, 0) é fundo externo
+                outside = int(labels[0, 0]) + offset
+            if prev_row is not None:
+                background.union_pairs(_boundary_pairs(prev_row, self._global_row(labels[0], offset), False))
+            prev_row = self._global_row(labels[-1], offset)
+        bg_roots = background.roots()
+        outside_root = bg_roots[outside] if outside is not None else -1
+        
+        # Passo 2: componentes 8-conexos da máscara com os buracos preenchidos
+        components = _UnionFind()
+        pieces = []
+        prev_row = None
+        strips = self._iter_strip_masks(image, mode, threshold, strip_height)
+        for (y0, binary), bg_offset in zip(strips, offsets):
+            num_bg, bg_labels = cv2.connectedComponents(cv2.bitwise_not(binary), connectivity=4,
+                                                        ltype=cv2.CV_32S)
+            is_hole = np.zeros(num_bg, dtype=bool)
+            is_hole[1:] = bg_roots[bg_offset + 1:bg_offset + num_bg] != outside_root
+            filled = binary | (is_hole[bg_labels].view(np.uint8) * 255)
             
-            # Amostras nos 4 cantos, levemente para dentro
-            samples = [
-                gray[margin_h:margin_h+corner_size, margin_w:margin_w+corner_size],
-                gray[margin_h:margin_h+corner_size, -margin_w-corner_size:-margin_w],
-                gray[-margin_h-corner_size:-margin_h, margin_w:margin_w+corner_size],
-                gray[-margin_h-corner_size:-margin_h, -margin_w-corner_size:-margin_w]
-            ]
-            avg_corner_val = np.mean([np.mean(s) for s in samples])
-            is_light_bg = avg_corner_val > 127
+            num_labels, labels, cc_stats, centroids = cv2.connectedComponentsWithStats(
+                filled, connectivity=8, ltype=cv2.CV_32S)
+            offset = components.add(num_labels - 1) - 1
+            if prev_row is not None:
+                components.union_pairs(_boundary_pairs(prev_row, self._global_row(labels[0], offset), True))
+            prev_row = self._global_row(labels[-1], offset)
             
-            if is_light_bg:
-                # Fundo claro: inverter threshold para que sprites fiquem brancos
-                # Usamos o threshold como uma margem de "quão diferente deve ser do fundo"
-                # Se o fundo é 255 e threshold é 10, pegamos tudo < 245
-                _, binary = cv2.threshold(gray, 255 - threshold, 255, cv2.THRESH_BINARY_INV)
-            else:
-                # Fundo escuro: threshold normal
-                _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+            piece = np.empty((num_labels - 1, 7), dtype=np.float64)
+            piece[:, 0] = cc_stats[1:, cv2.CC_STAT_LEFT]
+            piece[:, 1] = cc_stats[1:, cv2.CC_STAT_TOP] + y0
+            piece[:, 2] = piece[:, 0] + cc_stats[1:, cv2.CC_STAT_WIDTH]
+            piece[:, 3] = piece[:, 1] + cc_stats[1:, cv2.CC_STAT_HEIGHT]
+            piece[:, 4] = cc_stats[1:, cv2.CC_STAT_AREA]
+            piece[:, 5] = centroids[1:, 0] * piece[:, 4]
+            piece[:, 6] = (centroids[1:, 1] + y0) * piece[:, 4]
+            pieces.append(piece)
+        
+        stats = self._merge_pieces(pieces, components.roots())
+        self._last_binary_mask = None
+        self._last_labels = None
+        
+        return self._build_sprites(image, self._filter_and_sort(stats, min_area), layout_hint)
+
+    def detect_sprites_pyramid(self, threshold: int = 10, min_area: int = 100, layout_hint: str = None,
+                               engine: str = "contours", block_size: int = 32) -> List[Sprite]:
+        """
+        Detecção grosso-para-fino: só processa em resolução total as regiões ocupadas
+
+        Uma cópia reduzida da folha (máximo/mínimo por canal em blocos de
+        block_size px) serve de mapa de ocupação: como a conversão para cinza é
+        monótona, um bloco sem nenhum pixel que possa passar no threshold é vazio
+        com certeza. Blocos ocupados, com um bloco de margem, são agrupados em
+        regiões candidatas; binarização, morfologia e busca de componentes rodam
+        apenas dentro delas. A margem cobre o alcance da morfologia, então os
+        bboxes são idênticos aos de detect_sprites com o mesmo motor (tolerância
+        de 0 px); block_size só troca granularidade por custo do mapa.
+
+        Args:
+            threshold: Sensibilidade da binarização (1-255)
+            min_area: Área mínima, com a mesma medida do motor escolhido
+            layout_hint: Layout conhecido ("3x2", "2x3", "2x2") ou None para automático
+            engine: Motor de detecção ("contours" ou "components")
+            block_size: Lado dos blocos do mapa de ocupação (mínimo STRIP_HALO)
+        """
+        if engine not in DETECTION_ENGINES:
+            raise ValueError(f"Motor de detecção desconhecido: {engine}")
+
+        if self.original_image is None:
+            return []
         
+        image = self.original_image
+        height, width = image.shape[:2]
+        block = max(int(block_size), STRIP_HALO)
+        mode = self._binarization_mode(image)
+        
+        # Mapa de ocupação por blocos, dilatado em um bloco para servir de margem
+        occupied = (self._block_levels(image, mode, block) >= self._foreground_level(mode, threshold))
+        grid = cv2.dilate(occupied.view(np.uint8), np.ones((3, 3), np.uint8))
+        num_regions, regions, region_stats, _ = cv2.connectedComponentsWithStats(
+            grid, connectivity=8, ltype=cv2.CV_32S)
+        
+        mask = np.zeros((height, width), dtype=np.uint8)
+        pieces = []
+        for region in range(1, num_regions):
+            bx, by, bw, bh = region_stats[region, :4]
+            x0, y0 = bx * block, by * block
+            x1, y1 = min((bx + bw) * block, width), min((by + bh) * block, height)
+            roi_mask = self._binarize(image[y0:y1, x0:x1], mode, threshold)
+            # Descartar pedaços de outras regiões que caem no mesmo retângulo
+            in_region = (regions[by:by + bh, bx:bx + bw] == region).view(np.uint8)
+            in_region = np.repeat(np.repeat(in_region, block, axis=0), block, axis=1)
+            roi_mask &= in_region[:y1 - y0, :x1 - x0] * 255
+            mask[y0:y1, x0:x1] |= roi_mask
+            
+            binary = roi_mask.copy()
+            self._clear_border(binary, y0, height, x0, width)
+            stats, _ = self._component_stats(binary, engine)
+            stats[:, [STAT_X, STAT_CX]] += x0
+            stats[:, [STAT_Y, STAT_CY]] += y0
+            stats[:, STAT_LABEL] = -1
+            pieces.append(stats)
+        
+        stats = np.concatenate(pieces) if pieces else np.empty((0, 8), dtype=np.float64)
+        self._last_binary_mask = mask
+        self._last_labels = None
+        self._mask_threshold = None
+        
+        return self._build_sprites(image, self._filter_and_sort(stats, min_area), layout_hint)
+
+    @staticmethod
+    def _foreground_level(mode: str, threshold: int) -> int:
+        """Menor valor de _block_levels que pode ser primeiro plano no threshold dado"""
+        if mode == "alpha":
+            return 1 # alpha > 0
+        if mode == "light":
+            return threshold # 255 - cinza >= threshold
+        return threshold + 1 # cinza > threshold
+
+    @classmethod
+    def _block_levels(cls, image: np.ndarray, mode: str, block: int) -> np.ndarray:
+        """
+        Cota superior, por bloco, do nível de primeiro plano (alpha, cinza ou 255 - cinza).
+        Reduz os canais por bloco antes de converter para cinza; como o cinza é
+        monótono em cada canal, o resultado nunca subestima o bloco.
+        """
+        def reduce(array, ufunc):
+            # Combinar linhas/colunas com o mesmo deslocamento dentro do bloco:
+            # operações elemento a elemento são muito mais rápidas que reduceat
+            for axis in (0, 1):
+                step = [slice(None)] * array.ndim
+                step[axis] = slice(0, None, block)
+                out = array[tuple(step)].copy()
+                for k in range(1, block):
+                    step[axis] = slice(k, None, block)
+                    part = array[tuple(step)]
+                    # O último bloco pode ser incompleto
+                    target = out[:part.shape[0]] if axis == 0 else out[:, :part.shape[1]]
+                    ufunc(target, part, out=target)
+                array = out
+            return array
+        
+        if mode == "alpha":
+            return reduce(image[:, :, 3], np.maximum)
+        if image.ndim == 3:
+            image = image[:, :, :3]
+        if mode == "light":
+            return 255 - cls._to_gray(np.ascontiguousarray(reduce(image, np.minimum)))
+        return cls._to_gray(np.ascontiguousarray(reduce(image, np.maximum)))
+
+    def _iter_strip_masks(self, image: np.ndarray, mode: str, threshold: int, strip_height: int):
+        """Gera (y0, máscara) para cada faixa, exata graças à margem de STRIP_HALO linhas"""
+        height = image.shape[0]
+        for y0 in range(0, height, strip_height):
+            y1 = min(y0 + strip_height, height)
+            top = max(y0 - STRIP_HALO, 0)
+            bottom = min(y1 + STRIP_HALO, height)
+            binary = self._binarize(image[top:bottom], mode, threshold)[y0 - top:y1 - top]
+            binary = np.ascontiguousarray(binary)
+            self._clear_border(binary, y0, height)
+            yield y0, binary
+
+    @staticmethod
+    def _global_row(labels_row: np.ndarray, offset: int) -> np.ndarray:
+        """Converte uma linha de rótulos locais em ids globais (-1 para o rótulo 0)"""
+        return np.where(labels_row > 0, labels_row.astype(np.int64) + offset, -1)
+
+    @staticmethod
+    def _merge_pieces(pieces: List[np.ndarray], roots: np.ndarray) -> np.ndarray:
+        """Agrega os pedaços de componentes por raiz do union-find em estatísticas (N, 8)"""
+        if not pieces or len(roots) == 0:
+            return np.empty((0, 8), dtype=np.float64)
+        piece = np.concatenate(pieces)
+        unique_roots, group = np.unique(roots, return_inverse=True)
+        n = len(unique_roots)
+        x0 = np.full(n, np.inf); np.minimum.at(x0, group, piece[:, 0])
+        y0 = np.full(n, np.inf); np.minimum.at(y0, group, piece[:, 1])
+        x1 = np.zeros(n); np.maximum.at(x1, group, piece[:, 2])
+        y1 = np.zeros(n); np.maximum.at(y1, group, piece[:, 3])
+        area = np.bincount(group, weights=piece[:, 4], minlength=n)
+        stats = np.empty((n, 8), dtype=np.float64)
+        stats[:, STAT_X] = x0
+        stats[:, STAT_Y] = y0
+        stats[:, STAT_W] = x1 - x0
+        stats[:, STAT_H] = y1 - y0
+        stats[:, STAT_AREA] = area
+        stats[:, STAT_CX] = np.bincount(group, weights=piece[:, 5], minlength=n) / area
+        stats[:, STAT_CY] = np.bincount(group, weights=piece[:, 6], minlength=n) / area
+        # Sem mapa de rótulos no modo em faixas
+        stats[:, STAT_LABEL] = -1
+        return stats
+
+    @staticmethod
+    def _filter_and_sort(stats: np.ndarray, min_area: int) -> np.ndarray:
+        """Filtra por área mínima e ordena as estatísticas em ordem de leitura"""
+        # Filtrar por área mínima com uma máscara vetorizada
+        stats = stats[stats[:, STAT_AREA] >= min_area]
+        
+        # Ordenar bounding boxes: primeiro por Y (linha), depois por X (coluna)
+        row_key = np.round(stats[:, STAT_Y] / 50) * 50
+        return stats[np.lexsort((stats[:, STAT_X], row_key))]
+
+    def _build_sprites(self, image: np.ndarray, stats: np.ndarray,
+                       layout_hint: str = None) -> List[Sprite]:
+        """Converte estatísticas já filtradas e ordenadas em objetos Sprite e classifica as vistas"""
+        self.sprites = []
+        bboxes = stats[:, :4].astype(np.int64)
+        # Linha i das estatísticas corresponde a self.sprites[i]
+        self._last_component_stats = stats
+        
+        # Criar objetos Sprite
+        for idx, (x, y, w, h) in enumerate(bboxes.tolist()):
+            sprite_img = image[y:y+h, x:x+w]
+            sprite = Sprite(bbox=(x, y, w, h), image=sprite_img, index=idx)
+            self.sprites.append(sprite)
+        
+        # Classificar vistas
+        if len(self.sprites) > 0:
+            self._classify_views(layout_hint)
+        
+        return self.sprites
+
+    def _binarization_mode(self, image: np.ndarray, strip_height: int = 1024) -> str:
+        """
+        Decide como binarizar a folha inteira: "alpha", "light" (fundo claro) ou "dark".
+        Percorre a imagem em faixas para não criar buffers do tamanho da imagem.
+        """
+        # Se a imagem tiver canal alpha, verificar se é útil (não totalmente sólido)
+        if image.ndim == 3 and image.shape[2] == 4: # BGRA
+            for y0 in range(0, image.shape[0], strip_height):
+                # Se houver qualquer pixel transparente (alpha < 255), consideramos o alpha útil
+                if not np.all(image[y0:y0 + strip_height, :, 3] == 255):
+                    return "alpha"
+        
+        # Caso contrário, usar thresholding na imagem em escala de cinza
+        # Detectar se o fundo é claro ou escuro baseando-se nos cantos
+        # Amostrar pequenas áreas nos cantos, com uma margem para ignorar molduras
+        h, w = image.shape[:2]
+        margin_h = min(20, h // 50)
+        margin_w = min(20, w // 50)
+        corner_size = 10
+        
+        # Amostras nos 4 cantos, levemente para dentro
+        samples = [
+            image[margin_h:margin_h+corner_size, margin_w:margin_w+corner_size],
+            image[margin_h:margin_h+corner_size, -margin_w-corner_size:-margin_w],
+            image[-margin_h-corner_size:-margin_h, margin_w:margin_w+corner_size],
+            image[-margin_h-corner_size:-margin_h, -margin_w-corner_size:-margin_w]
+        ]
+        # Amostras vazias (imagens minúsculas) resultam em NaN, como np.mean de um array vazio
+        avg_corner_val = np.mean([np.mean(self._to_gray(s)) if s.size else np.nan for s in samples])
+        return "light" if avg_corner_val > 127 else "dark"
+
+    @staticmethod
+    def _to_gray(image: np.ndarray) -> np.ndarray:
+        """Converte para escala de cinza se a imagem tiver 3 ou 4 canais (BGR/BGRA)"""
+        if len(image.shape) == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image # Já é grayscale ou tem 1 canal
+
+    def _binarize(self, image: np.ndarray, mode: str, threshold: int) -> np.ndarray:
+        """Binariza uma região da imagem no modo dado e aplica a limpeza morfológica"""
+        if mode == "alpha":
+            # Binarizar o canal alpha: pixels com alguma opacidade são considerados parte do sprite
+            _, binary = cv2.threshold(np.ascontiguousarray(image[:, :, 3]), 0, 255, cv2.THRESH_BINARY)
+        elif mode == "light":
+            # Fundo claro: inverter threshold para que sprites fiquem brancos
+            # Usamos o threshold como uma margem de "quão diferente deve ser do fundo"
+            # Se o fundo é 255 e threshold é 10, pegamos tudo < 245
+            _, binary = cv2.threshold(self._to_gray(image), 255 - threshold, 255, cv2.THRESH_BINARY_INV)
+        else:
+            # Fundo escuro: threshold normal
+            _, binary = cv2.threshold(self._to_gray(image), threshold, 255, cv2.THRESH_BINARY)
+        
+        return self._clean_mask(binary)
+
+    @staticmethod
+    def _clean_mask(binary: np.ndarray) -> np.ndarray:
+        """
+        Limpeza morfológica da máscara. Usa apenas elementos estruturantes planos,
+        então também vale para imagens em níveis de cinza e comuta com o threshold.
+        """
         # Limpar ruído e separar sprites próximos
         # 1. Opening para remover ruído pequeno
         kernel_small = np.ones((3, 3), np.uint8)
@@ -116,40 +664,70 @@ class SpriteExtractor:
         # 3. Dilate para restaurar o corpo do sprite (menos que a erosão para manter separação)
         binary = cv2.dilate(binary, kernel_small, iterations=1)
         
-        self._last_binary_mask = binary.copy() # Salvar para preview no UI
-        
+        return binary
+
+    @staticmethod
+    def _clear_border(binary: np.ndarray, y0: int, image_height: int,
+                      x0: int = 0, image_width: Optional[int] = None):
+        """
+        Zera a moldura da imagem em uma máscara que cobre as linhas [y0, y0 + altura)
+        e as colunas [x0, x0 + largura) (por padrão, todas as colunas)
+        """
+        if image_width is None:
+            image_width = binary.shape[1]
         # Limpar bordas agressivamente (garantir que molduras ou sombras de borda não junte tudo)
         border = 20 # Aumentado para 20px para ignorar molduras comuns em JPEGs
-        binary[0:border, :] = 0
-        binary[-border:, :] = 0
-        binary[:, 0:border] = 0
-        binary[:, -border:] = 0
-        
-        # Encontrar contornos
+        binary[0:max(border - y0, 0), :] = 0
+        binary[max(image_height - border - y0, 0):, :] = 0
+        binary[:, 0:max(border - x0, 0)] = 0
+        binary[:, max(image_width - border - x0, 0):] = 0
+
+    def _find_components(self, mask: np.ndarray, engine: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Encontra as regiões de primeiro plano da máscara binária.
+
+        Returns:
+            Array (N, 8) float64 com colunas x, y, largura, altura, área, cx, cy e
+            rótulo no mapa de rótulos (-1 no motor "contours"; ver constantes STAT_*),
+            e o mapa de rótulos (None no motor "contours")
+        """
+        binary = mask.copy()
+        self._clear_border(binary, 0, binary.shape[0])
+        return self._component_stats(binary, engine)
+
+    @classmethod
+    def _component_stats(cls, binary: np.ndarray, engine: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Estatísticas de componentes de uma máscara com a moldura já zerada"""
+        if engine == "components":
+            # Preencher buracos para equivaler ao RETR_EXTERNAL: ilhas dentro de um
+            # buraco de outra forma não devem virar sprites separados
+            filled = cls._fill_holes(binary)
+            num_labels, labels, cc_stats, centroids = cv2.connectedComponentsWithStats(
+                filled, connectivity=8, ltype=cv2.CV_32S)
+            # Rótulo 0 é o fundo
+            stats = np.empty((num_labels - 1, 8), dtype=np.float64)
+            stats[:, :5] = cc_stats[1:, :5]
+            stats[:, STAT_CX:STAT_CY + 1] = centroids[1:]
+            stats[:, STAT_LABEL] = np.arange(1, num_labels)
+            # O mapa de rótulos é mantido para reutilização por etapas posteriores
+            return stats, labels
+        
+        # Motor legado: contornos externos, área pelo polígono do contorno
         contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Extrair bounding boxes
-        bboxes = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area >= min_area:
-                x, y, w, h = cv2.boundingRect(contour)
-                bboxes.append((x, y, w, h))
-        
-        # Ordenar bounding boxes: primeiro por Y (linha), depois por X (coluna)
-        bboxes.sort(key=lambda b: (round(b[1] / 50) * 50, b[0]))
-        
-        # Criar objetos Sprite
-        for idx, (x, y, w, h) in enumerate(bboxes):
-            sprite_img = image[y:y+h, x:x+w]
-            sprite = Sprite(bbox=(x, y, w, h), image=sprite_img, index=idx)
-            self.sprites.append(sprite)
-        
-        # Classificar vistas
-        if len(self.sprites) > 0:
-            self._classify_views(layout_hint)
-        
-        return self.sprites
+        stats = np.empty((len(contours), 8), dtype=np.float64)
+        for i, contour in enumerate(contours):
+            x, y, w, h = cv2.boundingRect(contour)
+            stats[i] = (x, y, w, h, cv2.contourArea(contour), x + w / 2, y + h / 2, -1)
+        return stats, None
+
+    @staticmethod
+    def _fill_holes(binary: np.ndarray) -> np.ndarray:
+        """Preenche os buracos da máscara (fundo não conectado à borda)"""
+        # A borda da máscara já foi zerada, então (0, 0) é sempre fundo externo
+        flooded = binary.copy()
+        mask = np.zeros((binary.shape[0] + 2, binary.shape[1] + 2), np.uint8)
+        cv2.floodFill(flooded, mask, (0, 0), 255)
+        return binary | cv2.bitwise_not(flooded)
     
     def _classify_views(self, layout_hint: str = None):
         """
@@ -173,7 +751,7 @@ class SpriteExtractor:
             return
 
         # Fallback para detecção automática
-        rows, cols = self._detect_grid_structure()
+        row_of, col_of, rows, cols = self._grid_positions()
         
         # Padrões de nomenclatura baseados no número total de sprites e grid
         if num_sprites == 1:
@@ -214,60 +792,38 @@ class SpriteExtractor:
         
         else:
             # Para outros casos, usar row/col
-            for sprite in self.sprites:
-                r, c = self._get_sprite_grid_position(sprite, rows, cols)
+            for sprite, r, c in zip(self.sprites, row_of.tolist(), col_of.tolist()):
                 sprite.view_type = f"row{r+1}_col{c+1}"
 
     def _detect_grid_structure(self) -> Tuple[int, int]:
         """
         Detecta a estrutura do grid baseado nas posições centrais dos sprites
         """
+        _, _, num_rows, num_cols = self._grid_positions()
+        return (num_rows, num_cols)
+    
+    def _grid_positions(self) -> Tuple[np.ndarray, np.ndarray, int, int]:
+        """
+        Atribui linha e coluna do grid a todos os sprites de uma vez.
+
+        Returns:
+            (linhas, colunas, número de linhas, número de colunas), com um índice
+            de linha/coluna por sprite na ordem de self.sprites
+        """
         if not self.sprites:
-            return (0, 0)
+            empty = np.empty(0, dtype=np.int64)
+            return (empty, empty, 0, 0)
         
+        bboxes = np.array([s.bbox for s in self.sprites], dtype=np.int64)
         # Usar o centro do sprite para agrupar, pois as alturas variam muito (ex: antena)
-        y_centers = sorted([s.bbox[1] + s.bbox[3]//2 for s in self.sprites])
-        x_centers = sorted([s.bbox[0] + s.bbox[2]//2 for s in self.sprites])
-        
-        # Agrupar posições por proximidade
-        def count_clusters(positions, tolerance=100):
-            if not positions: return 0
-            clusters = 1
-            for i in range(1, len(positions)):
-                if positions[i] - positions[i-1] > tolerance:
-                    clusters += 1
-            return clusters
-        
-        num_rows = count_clusters(y_centers)
-        num_cols = count_clusters(x_centers)
-        
-        return (num_rows, num_cols)
-    
-    def _get_sprite_grid_position(self, sprite: Sprite, rows: int, cols: int) -> Tuple[int, int]:
-        """
-        Retorna a posição no grid (índice da linha, índice da coluna) usando centros
-        """
-        y_centers = sorted([s.bbox[1] + s.bbox[3]//2 for s in self.sprites])
-        x_centers = sorted([s.bbox[0] + s.bbox[2]//2 for s in self.sprites])
-        
-        def get_cluster_index(val, positions, tolerance=100):
-            unique_clusters = []
-            for p in positions:
-                if not any(abs(p - c) < tolerance for c in unique_clusters):
-                    unique_clusters.append(p)
-            unique_clusters.sort()
-            center = val
-            for i, c in enumerate(unique_clusters):
-                if abs(center - c) < tolerance:
-                    return i
-            return 0
-        
-        sprite_y_center = sprite.bbox[1] + sprite.bbox[3]//2
-        sprite_x_center = sprite.bbox[0] + sprite.bbox[2]//2
-        
-        r = get_cluster_index(sprite_y_center, y_centers)
-        c = get_cluster_index(sprite_x_center, x_centers)
-        return (r, c)
+        y_centers = bboxes[:, 1] + bboxes[:, 3] // 2
+        x_centers = bboxes[:, 0] + bboxes[:, 2] // 2
+        
+        # Tolerância proporcional ao tamanho típico dos sprites: centros da mesma
+        # linha/coluna diferem bem menos que meio sprite
+        rows, num_rows = _cluster_positions(y_centers, np.median(bboxes[:, 3]) / 2)
+        cols, num_cols = _cluster_positions(x_centers, np.median(bboxes[:, 2]) / 2)
+        return (rows, cols, num_rows, num_cols)
     
     def get_sprite(self, index: int) -> Optional[Sprite]:
         """
@@ -377,13 +933,15 @@ class SpriteExtractor:
         return exported_files
     
     
-    def get_preview_image(self, draw_boxes: bool = True, selected_index: int = -1) -> Optional[np.ndarray]:
+    def get_preview_image(self, draw_boxes: bool = True, selected_index: int = -1,
+                          selected_indices: Optional[Set[int]] = None) -> Optional[np.ndarray]:
         """
         Retorna uma imagem de preview com bounding boxes opcionais
         
         Args:
             draw_boxes: Se True, desenha retângulos ao redor dos sprites
             selected_index: Índice do sprite selecionado para realce
+            selected_indices: Índices de outros sprites selecionados (seleção múltipla)
             
         Returns:
             Imagem de preview ou None
@@ -407,7 +965,7 @@ class SpriteExtractor:
                 thickness = 2
                 
                 # Destacar se selecionado
-                if sprite.index == selected_index:
+                if sprite.index == selected_index or (selected_indices and sprite.index in selected_indices):
                     color = (0, 0, 255) # Vermelho para seleção
                     thickness = 4
                 
@@ -421,4 +979,17 @@ class SpriteExtractor:
 
     def get_binary_mask_preview(self) -> Optional[np.ndarray]:
         """Retorna a última máscara binária gerada"""
+        if self._last_binary_mask is None and self._mask_threshold is not None:
+            # Detecção respondida pelo índice: gerar a máscara só quando pedida
+            index = self._threshold_index
+            if index is not None and index.source is self.original_image:
+                self._last_binary_mask = index.mask(self._mask_threshold)
         return self._last_binary_mask
+
+    def get_label_map(self) -> Optional[np.ndarray]:
+        """Retorna o último mapa de rótulos (somente motor "components"; ver coluna STAT_LABEL)"""
+        return self._last_labels
+
+    def get_component_stats(self) -> Optional[np.ndarray]:
+        """Retorna as estatísticas (N, 8) da última detecção; a linha i corresponde a self.sprites[i]"""
+        return self._last_component_stats
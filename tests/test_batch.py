@@ -0,0 +1,122 @@
+"""
+Tests for headless batch processing
+"""
+import threading
+from pathlib import Path
+
+import cv2
+import pytest
+
+from batch import (
+    BatchParams, BatchRunner, find_images, image_pixels, process_sheet, run_pipeline, summarize
+)
+
+
+@pytest.fixture
+def batch_input(tmp_path, sample_sprite_sheet):
+    """Folder with three sprite sheets (one in a subfolder) and one blank image"""
+    folder = tmp_path / "input"
+    (folder / "sub").mkdir(parents=True)
+    for name in ("a.png", "b.png", "sub/c.png"):
+        cv2.imwrite(str(folder / name), sample_sprite_sheet)
+    cv2.imwrite(str(folder / "blank.png"), sample_sprite_sheet * 0)
+    (folder / "notes.txt").write_text("not an image")
+    return folder
+
+
+class TestBatchHelpers:
+    """Tests for file discovery and single-sheet processing"""
+    
+    def test_find_images(self, batch_input):
+        """Test recursive and flat discovery of image files"""
+        assert [p.name for p in find_images(batch_input)] == ["a.png", "b.png", "blank.png", "c.png"]
+        assert len(find_images(batch_input, recursive=False)) == 3
+    
+    def test_image_pixels_reads_header(self, batch_input):
+        """Test pixel count from the image header, 0 for non-images"""
+        assert image_pixels(batch_input / "a.png") == 200 * 200
+        assert image_pixels(batch_input / "notes.txt") == 0
+    
+    def test_process_sheet(self, batch_input, output_dir):
+        """Test that one sheet is exported to its own subfolder"""
+        result = process_sheet(batch_input / "a.png", output_dir, BatchParams(prefix="x"))
+        
+        assert result["status"] == "ok"
+        assert result["sprites"] == 4
+        assert len(result["outputs"]) == 4
+        assert all((output_dir / "a").joinpath(f"x_a_{v}.png").exists() for v in ("front", "back", "left", "right"))
+    
+    def test_process_sheet_reports_errors(self, batch_input, output_dir):
+        """Test empty and unreadable sheets"""
+        assert process_sheet(batch_input / "blank.png", output_dir, BatchParams())["status"] == "empty"
+        result = process_sheet(batch_input / "notes.txt", output_dir, BatchParams())
+        assert result["status"] == "error"
+        assert result["error"]
+
+
+class TestBatchRunner:
+    """Tests for the process pool runner"""
+    
+    def test_runs_all_files(self, batch_input, output_dir):
+        """Test that every file yields exactly one result"""
+        runner = BatchRunner(find_images(batch_input), output_dir, jobs=2)
+        results = list(runner.run())
+        
+        assert sorted(r["path"] for r in results) == sorted(str(p) for p in find_images(batch_input))
+        assert sorted(r["status"] for r in results) == ["empty", "ok", "ok", "ok"]
+        assert (output_dir / "c").is_dir()
+    
+    def test_pixel_budget_still_admits_one_file(self, batch_input, output_dir):
+        """Test that a budget smaller than any image serializes instead of stalling"""
+        runner = BatchRunner(find_images(batch_input), output_dir, jobs=2, max_pending_pixels=1)
+        
+        assert len(list(runner.run())) == 4
+    
+    def test_cancel_stops_submitting(self, batch_input, output_dir):
+        """Test that cancelling after the first result skips the remaining files"""
+        runner = BatchRunner(find_images(batch_input) * 10, output_dir, jobs=1)
+        results = []
+        for result in runner.run():
+            results.append(result)
+            runner.cancel()
+        
+        assert runner.cancelled
+        assert 1 <= len(results) < 40
+    
+    def test_pause_and_resume(self, batch_input, output_dir):
+        """Test that a paused runner submits nothing until resumed"""
+        runner = BatchRunner(find_images(batch_input), output_dir, jobs=1)
+        runner.pause()
+        results = runner.run()
+        
+        threading.Timer(0.3, runner.resume).start()
+        assert len(list(results)) == 4
+        assert not runner.paused
+
+
+class TestPipeline:
+    """Tests for the threaded read/detect/encode pipeline"""
+    
+    def test_matches_process_sheet(self, batch_input, tmp_path):
+        """Test that the pipeline produces the same results as the pool worker"""
+        params = BatchParams(padding=2, uniform_size=True)
+        files = find_images(batch_input) + [batch_input / "notes.txt"]
+        seen = []
+        results = run_pipeline(files, tmp_path / "piped", params, jobs=2, queue_size=1, on_result=seen.append)
+        
+        assert [r["path"] for r in results] == sorted(str(f) for f in files)
+        assert len(seen) == len(files)
+        for result in results:
+            expected = process_sheet(result["path"], tmp_path / "pooled", params)
+            assert result["status"] == expected["status"]
+            assert result["sprites"] == expected["sprites"]
+            assert [Path(p).name for p in result["outputs"]] == [Path(p).name for p in expected["outputs"]]
+        ok = [r for r in results if r["status"] == "ok"]
+        assert all(set(r["stages"]) == {"decode", "detect", "encode"} for r in ok)
+    
+    def test_summary_totals(self, batch_input, output_dir):
+        """Test the aggregated totals of the JSON summary"""
+        summary = summarize(run_pipeline(find_images(batch_input), output_dir, jobs=1), jobs=1)
+        
+        assert summary["totals"] == {"files": 4, "sprites": 12, "ok": 3, "empty": 1, "error": 0}
+        assert summary["jobs"] == 1
@@ -37,3 +37,48 @@ def test_cli_invalid_arg():
     )
     assert result.returncode != 0
     assert "unrecognized arguments: --invalid-flag" in result.stderr
+
+
+def test_cli_batch(tmp_path, sample_sprite_sheet):
+    """Test the headless batch subcommand and its JSON summary"""
+    import json
+    import cv2
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name in ("a.png", "b.png"):
+        cv2.imwrite(str(input_dir / name), sample_sprite_sheet)
+    output_dir = tmp_path / "out"
+    
+    result = subprocess.run(
+        [sys.executable, "main.py", "batch", str(input_dir), str(output_dir), "--jobs", "2", "--padding", "4"],
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr
+    summary = json.loads((output_dir / "batch_summary.json").read_text())
+    assert summary["totals"] == {"files": 2, "sprites": 8, "ok": 2, "empty": 0, "error": 0}
+    assert summary["params"]["padding"] == 4
+    assert len(list((output_dir / "a").glob("*.png"))) == 4
+
+
+def test_cli_batch_does_not_import_qt(tmp_path):
+    """Test that the batch subcommand never imports PyQt6"""
+    code = (
+        "import sys, main; "
+        f"rc = main.batch_main([{str(tmp_path)!r}, {str(tmp_path / 'out')!r}]); "
+        "assert not any(m.startswith('PyQt6') for m in sys.modules), 'PyQt6 imported'; "
+        "sys.exit(rc)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_cli_batch_missing_input(tmp_path):
+    """Test that a missing input folder is reported by argparse"""
+    result = subprocess.run(
+        [sys.executable, "main.py", "batch", str(tmp_path / "missing"), str(tmp_path / "out")],
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 2
+    assert "usage: main.py batch" in result.stderr
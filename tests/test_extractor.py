@@ -3,8 +3,11 @@ Unit tests for SpriteExtractor core functionality
 """
 import pytest
 import numpy as np
+import cv2
 from pathlib import Path
 
+from sprite_extractor import STAT_LABEL
+
 
 class TestSpriteExtractor:
     """Tests for core sprite detection and extraction"""
@@ -110,3 +113,351 @@ class TestSpriteDataclass:
             assert hasattr(sprite, 'view_type')
             assert hasattr(sprite, 'bbox')
             assert hasattr(sprite, 'image')
+
+
+class TestComponentsEngine:
+    """Tests for the connected-components detection engine"""
+    
+    def test_components_matches_contours(self, extractor, sample_sprite_sheet_path):
+        """Test that both engines find the same bounding boxes"""
+        extractor.load_image(sample_sprite_sheet_path)
+        contour_boxes = [s.bbox for s in extractor.detect_sprites(engine="contours")]
+        component_boxes = [s.bbox for s in extractor.detect_sprites(engine="components")]
+        
+        assert component_boxes == contour_boxes
+    
+    def test_components_ignores_islands_inside_holes(self, extractor, tmp_path):
+        """Test that an island inside a hole is not a separate sprite (like RETR_EXTERNAL)"""
+        img = np.zeros((300, 300, 4), dtype=np.uint8)
+        img[20:200, 20:200] = (0, 0, 255, 255)
+        img[70:150, 70:150] = 0
+        img[90:130, 90:130] = (0, 255, 0, 255)
+        path = tmp_path / "hole.png"
+        cv2.imwrite(str(path), img)
+        extractor.load_image(str(path))
+        
+        contour_boxes = [s.bbox for s in extractor.detect_sprites(engine="contours")]
+        component_boxes = [s.bbox for s in extractor.detect_sprites(engine="components")]
+        
+        assert len(component_boxes) == 1
+        assert component_boxes == contour_boxes
+    
+    def test_components_stats_rows_match_sprites(self, extractor, tmp_path):
+        """Test that stats rows and label ids line up with sprites after filtering"""
+        img = np.zeros((300, 300, 4), dtype=np.uint8)
+        img[30:90, 150:210] = (0, 0, 255, 255)    # large, top right
+        img[30:40, 40:50] = (0, 255, 0, 255)      # small, filtered out
+        img[150:200, 40:100] = (255, 0, 0, 255)   # large, bottom left
+        path = tmp_path / "filtered.png"
+        cv2.imwrite(str(path), img)
+        extractor.load_image(str(path))
+        
+        sprites = extractor.detect_sprites(min_area=500, engine="components")
+        stats = extractor.get_component_stats()
+        labels = extractor.get_label_map()
+        
+        assert len(sprites) == len(stats) == 2
+        for sprite, row in zip(sprites, stats):
+            assert tuple(int(v) for v in row[:4]) == sprite.bbox
+            x, y, w, h = sprite.bbox
+            assert labels[y + h // 2, x + w // 2] == int(row[STAT_LABEL])
+    
+    def test_components_keeps_label_map_and_stats(self, extractor, sample_sprite_sheet_path):
+        """Test that the label map and per-component stats are kept"""
+        extractor.load_image(sample_sprite_sheet_path)
+        sprites = extractor.detect_sprites(engine="components")
+        
+        labels = extractor.get_label_map()
+        stats = extractor.get_component_stats()
+        assert labels.shape == (200, 200)
+        assert stats.shape == (4, 8)
+        # Centroids fall inside their bounding boxes
+        for x, y, w, h, area, cx, cy, label in stats:
+            assert x <= cx <= x + w and y <= cy <= y + h
+            assert area <= w * h
+        assert len(sprites) == 4
+    
+    def test_components_min_area_filter(self, extractor, sample_sprite_sheet_path):
+        """Test that min_area filters components by pixel area"""
+        extractor.load_image(sample_sprite_sheet_path)
+        
+        assert extractor.detect_sprites(min_area=100000, engine="components") == []
+    
+    def test_unknown_engine(self, extractor, sample_sprite_sheet_path):
+        """Test that an unknown engine is rejected"""
+        extractor.load_image(sample_sprite_sheet_path)
+        
+        with pytest.raises(ValueError):
+            extractor.detect_sprites(engine="magic")
+
+
+class TestTiledDetection:
+    """Tests for strip-by-strip (out-of-core) detection"""
+    
+    def test_tiled_matches_components(self, extractor, sample_sprite_sheet_path):
+        """Test that strips of any height give the in-memory components result"""
+        extractor.load_image(sample_sprite_sheet_path)
+        expected = [s.bbox for s in extractor.detect_sprites(engine="components")]
+        expected_stats = extractor.get_component_stats()
+        
+        for strip_height in (1, 13, 64, 1000):
+            sprites = extractor.detect_sprites_tiled(strip_height=strip_height)
+            assert [s.bbox for s in sprites] == expected
+            assert np.allclose(extractor.get_component_stats()[:, :7], expected_stats[:, :7])
+    
+    def test_tiled_merges_holes_across_strips(self, extractor, tmp_path):
+        """Test that a shape with a hole and island spanning strips stays one sprite"""
+        img = np.full((300, 300, 3), 255, dtype=np.uint8)
+        img[20:200, 20:200] = 0
+        img[70:150, 70:150] = 255
+        img[90:130, 90:130] = 0
+        path = tmp_path / "hole_light.png"
+        cv2.imwrite(str(path), img)
+        extractor.load_image(str(path))
+        
+        expected = [s.bbox for s in extractor.detect_sprites(engine="components")]
+        sprites = extractor.detect_sprites_tiled(strip_height=25)
+        
+        assert len(sprites) == 1
+        assert [s.bbox for s in sprites] == expected
+    
+    def test_load_npy_memmap(self, extractor, sample_sprite_sheet, tmp_path):
+        """Test that .npy sheets are memory-mapped and detectable in strips"""
+        path = tmp_path / "sheet.npy"
+        np.save(path, sample_sprite_sheet)
+        
+        assert extractor.load_image(str(path)) is True
+        assert isinstance(extractor.original_image, np.memmap)
+        assert len(extractor.detect_sprites_tiled(strip_height=50)) == 4
+
+
+class TestStageCache:
+    """Tests for the memoized detection pipeline"""
+    
+    @staticmethod
+    def _count_calls(monkeypatch, extractor, name):
+        calls = []
+        original = getattr(extractor, name)
+        
+        def wrapper(*args, **kwargs):
+            calls.append(args)
+            return original(*args, **kwargs)
+        monkeypatch.setattr(extractor, name, wrapper)
+        return calls
+    
+    def test_min_area_change_only_refilters(self, monkeypatch, extractor, sample_sprite_sheet_path):
+        """Test that changing min_area reuses the mask and components"""
+        extractor.load_image(sample_sprite_sheet_path)
+        binarize = self._count_calls(monkeypatch, extractor, "_binarize")
+        components = self._count_calls(monkeypatch, extractor, "_find_components")
+        
+        assert len(extractor.detect_sprites(min_area=100)) == 4
+        assert len(extractor.detect_sprites(min_area=100000)) == 0
+        assert len(extractor.detect_sprites(min_area=100)) == 4
+        
+        assert len(binarize) == 1
+        assert len(components) == 1
+    
+    def test_layout_change_only_reclassifies(self, monkeypatch, extractor, sample_sprite_sheet_path):
+        """Test that changing the layout hint skips filtering and sorting"""
+        extractor.load_image(sample_sprite_sheet_path)
+        extractor.detect_sprites()
+        filtering = self._count_calls(monkeypatch, extractor, "_filter_and_sort")
+        
+        sprites = extractor.detect_sprites(layout_hint="2x2")
+        
+        assert filtering == []
+        assert [s.view_type for s in sprites] == ["front", "back", "left", "right"]
+    
+    def test_threshold_change_recomputes(self, monkeypatch, extractor, sample_sprite_sheet_path):
+        """Test that a new threshold runs the pixel stages again"""
+        extractor.load_image(sample_sprite_sheet_path)
+        binarize = self._count_calls(monkeypatch, extractor, "_binarize")
+        
+        extractor.detect_sprites(threshold=10)
+        extractor.detect_sprites(threshold=20)
+        
+        assert len(binarize) == 2
+    
+    def test_new_image_invalidates_cache(self, extractor, sample_sprite_sheet_path):
+        """Test that loading another image does not reuse stale results"""
+        extractor.load_image(sample_sprite_sheet_path)
+        assert len(extractor.detect_sprites()) == 4
+        
+        extractor.original_image = np.zeros((200, 200, 4), dtype=np.uint8)
+        assert extractor.detect_sprites() == []
+    
+    def test_lru_eviction_respects_budget(self, sample_sprite_sheet_path):
+        """Test that the cache evicts old entries beyond its byte budget"""
+        from sprite_extractor import SpriteExtractor
+        extractor = SpriteExtractor(cache_bytes=300_000)
+        extractor.load_image(sample_sprite_sheet_path)
+        
+        for threshold in range(1, 10):
+            assert len(extractor.detect_sprites(threshold=threshold)) == 4
+        
+        cache = extractor._stage_cache
+        masks = [key for key in cache._entries if key[0] == "mask"]
+        assert cache._bytes <= 300_000
+        assert 0 < len(masks) < 9
+        assert ("mask", 9) in cache._entries
+
+
+@pytest.fixture
+def graded_sheet_path(tmp_path):
+    """Dark sheet with sprites of different brightness, so thresholds matter"""
+    img = np.full((240, 400, 3), 15, dtype=np.uint8)
+    for i, value in enumerate((60, 120, 180, 240)):
+        x = 40 + i * 85
+        img[60:180, x:x + 60] = value
+        img[100:140, x + 20:x + 40] = 15  # hole
+    path = tmp_path / "graded.png"
+    cv2.imwrite(str(path), img)
+    return str(path)
+
+
+class TestThresholdIndex:
+    """Tests for the precomputed per-threshold component index"""
+    
+    @pytest.mark.parametrize("engine", ["contours", "components"])
+    def test_index_matches_pipeline(self, extractor, graded_sheet_path, engine):
+        """Test that index answers equal the full pipeline for every threshold"""
+        extractor.load_image(graded_sheet_path)
+        expected = {}
+        for threshold in range(1, 256, 5):
+            sprites = extractor.detect_sprites(threshold=threshold, engine=engine)
+            expected[threshold] = ([s.bbox for s in sprites],
+                                   extractor.get_binary_mask_preview().copy())
+        
+        extractor.set_threshold_index(extractor.build_threshold_index(engine=engine))
+        assert extractor.has_threshold_index()
+        for threshold, (bboxes, mask) in expected.items():
+            sprites = extractor.detect_sprites(threshold=threshold, engine=engine)
+            assert [s.bbox for s in sprites] == bboxes
+            assert np.array_equal(extractor.get_binary_mask_preview(), mask)
+    
+    def test_index_skips_pixel_stages(self, monkeypatch, extractor, graded_sheet_path):
+        """Test that detection with an index does not binarize again"""
+        extractor.load_image(graded_sheet_path)
+        extractor.set_threshold_index(extractor.build_threshold_index())
+        monkeypatch.setattr(extractor, "_binarize", None)
+        
+        assert len(extractor.detect_sprites(threshold=100)) == 3
+        assert len(extractor.detect_sprites(threshold=200)) == 1
+    
+    def test_index_area_query(self, extractor, graded_sheet_path):
+        """Test querying components by threshold and minimum area"""
+        extractor.load_image(graded_sheet_path)
+        index = extractor.build_threshold_index()
+        
+        assert len(index.components(30)) == 4
+        assert len(index.components(30, min_area=10 ** 6)) == 0
+    
+    def test_index_not_used_for_other_image(self, extractor, graded_sheet_path, sample_sprite_sheet_path):
+        """Test that an index is dropped when another image is loaded"""
+        extractor.load_image(graded_sheet_path)
+        index = extractor.build_threshold_index()
+        extractor.load_image(sample_sprite_sheet_path)
+        extractor.set_threshold_index(index)
+        
+        assert not extractor.has_threshold_index()
+    
+    def test_alpha_sheet_has_no_index(self, extractor, sample_sprite_sheet_path):
+        """Test that alpha-based sheets do not build an index"""
+        extractor.load_image(sample_sprite_sheet_path)
+        
+        assert extractor.build_threshold_index() is None
+
+
+class TestPyramidDetection:
+    """Tests for coarse-to-fine detection with empty-block skipping"""
+    
+    @pytest.mark.parametrize("engine", ["contours", "components"])
+    @pytest.mark.parametrize("block_size", [8, 32])
+    def test_pyramid_matches_full_resolution(self, extractor, graded_sheet_path, engine, block_size):
+        """Test that pyramid bboxes equal the full-resolution ones (0 px tolerance)"""
+        extractor.load_image(graded_sheet_path)
+        for threshold in (10, 100, 200):
+            expected = [s.bbox for s in extractor.detect_sprites(threshold=threshold, engine=engine)]
+            sprites = extractor.detect_sprites_pyramid(threshold=threshold, engine=engine,
+                                                       block_size=block_size)
+            assert [s.bbox for s in sprites] == expected
+    
+    def test_pyramid_alpha_sheet(self, extractor, sample_sprite_sheet_path):
+        """Test pyramid detection on a transparent sheet"""
+        extractor.load_image(sample_sprite_sheet_path)
+        expected = [s.bbox for s in extractor.detect_sprites()]
+        
+        assert [s.bbox for s in extractor.detect_sprites_pyramid(block_size=16)] == expected
+    
+    def test_pyramid_skips_empty_blocks(self, monkeypatch, extractor, tmp_path):
+        """Test that only occupied regions are binarized at full resolution"""
+        img = np.zeros((1024, 1024, 3), dtype=np.uint8)
+        img[100:160, 100:160] = 200
+        img[800:860, 700:760] = 200
+        path = tmp_path / "sparse.png"
+        cv2.imwrite(str(path), img)
+        extractor.load_image(str(path))
+        
+        processed = []
+        original = extractor._binarize
+        
+        def recording_binarize(region, mode, threshold):
+            processed.append(region.shape[0] * region.shape[1])
+            return original(region, mode, threshold)
+        monkeypatch.setattr(extractor, "_binarize", recording_binarize)
+        
+        sprites = extractor.detect_sprites_pyramid(block_size=32)
+        
+        assert len(sprites) == 2
+        assert len(processed) == 2
+        assert sum(processed) < 0.05 * 1024 * 1024
+
+
+class TestGridInference:
+    """Tests for row/column assignment of sprites"""
+    
+    @staticmethod
+    def _grid_sheet(tmp_path, rows, cols, size=30, step=50):
+        img = np.zeros((rows * step + 80, cols * step + 80, 4), dtype=np.uint8)
+        for r in range(rows):
+            for c in range(cols):
+                y, x = 40 + r * step, 40 + c * step
+                # Alternate heights so centers within a row are not identical
+                h = size if (r + c) % 2 else size - 8
+                img[y:y + h, x:x + size] = (255, 255, 255, 255)
+        path = tmp_path / f"grid_{rows}x{cols}.png"
+        cv2.imwrite(str(path), img)
+        return str(path)
+    
+    def test_grid_rows_and_cols_assigned(self, extractor, tmp_path):
+        """Test that every sprite of a 3x5 grid gets its row/col label"""
+        extractor.load_image(self._grid_sheet(tmp_path, 3, 5))
+        sprites = extractor.detect_sprites()
+        
+        assert len(sprites) == 15
+        assert extractor._detect_grid_structure() == (3, 5)
+        for sprite in sprites:
+            x, y, w, h = sprite.bbox
+            assert sprite.view_type == f"row{(y - 40) // 50 + 1}_col{(x - 40) // 50 + 1}"
+    
+    def test_tolerance_scales_with_sprite_size(self, extractor, tmp_path):
+        """Test that rows closer than the old fixed 100 px tolerance are separated"""
+        extractor.load_image(self._grid_sheet(tmp_path, 4, 4, size=20, step=30))
+        extractor.detect_sprites(min_area=50)
+        
+        assert extractor._detect_grid_structure() == (4, 4)
+    
+    def test_large_grid_is_fast(self, extractor, tmp_path):
+        """Test that classification scales to thousands of sprites"""
+        import time
+        extractor.load_image(self._grid_sheet(tmp_path, 50, 50, size=20, step=30))
+        
+        start = time.perf_counter()
+        sprites = extractor.detect_sprites(min_area=50)
+        elapsed = time.perf_counter() - start
+        
+        assert len(sprites) == 2500
+        assert len({s.view_type for s in sprites}) == 2500
+        assert "row50_col50" in {s.view_type for s in sprites}
+        assert elapsed < 5
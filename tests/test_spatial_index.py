@@ -0,0 +1,69 @@
+"""
+Tests for the sprite spatial index
+"""
+import numpy as np
+import pytest
+
+from spatial_index import SpatialIndex
+
+
+@pytest.fixture
+def grid_boxes():
+    """10x10 grid of 20x20 boxes spaced 50 px apart"""
+    return [(x, y, 20, 20) for y in range(0, 500, 50) for x in range(0, 500, 50)]
+
+
+class TestSpatialIndex:
+    """Tests for point and rectangle queries"""
+    
+    def test_query_point_hit_and_miss(self, grid_boxes):
+        """Test point queries inside, on the edge of and outside a box"""
+        index = SpatialIndex(grid_boxes)
+        
+        assert index.query_point(10, 10) == [0]
+        assert index.query_point(70, 20) == [1]  # inclusive edge
+        assert index.query_point(35, 35) == []
+    
+    def test_query_point_overlapping_returns_sorted_ids(self):
+        """Test that overlapping boxes all match, lowest id first"""
+        index = SpatialIndex([(0, 0, 100, 100), (40, 40, 20, 20)], ids=[7, 3])
+        
+        assert index.query_point(50, 50) == [3, 7]
+    
+    def test_query_rect_intersecting_and_contained(self, grid_boxes):
+        """Test rectangle queries in intersect and containment modes"""
+        index = SpatialIndex(grid_boxes)
+        
+        assert index.query_rect(10, 10, 60, 10) == [0, 1]
+        assert index.query_rect(60, 10, 10, 10) == [0, 1]  # any corner order
+        assert index.query_rect(-5, -5, 75, 25, contained=True) == [0, 1]
+        assert index.query_rect(10, 10, 60, 10, contained=True) == []
+    
+    def test_query_rect_matches_brute_force(self, grid_boxes):
+        """Test random rectangles against a linear scan"""
+        index = SpatialIndex(grid_boxes)
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            x0, y0, x1, y1 = rng.integers(-50, 550, 4)
+            lo_x, hi_x = sorted((x0, x1))
+            lo_y, hi_y = sorted((y0, y1))
+            expected = [i for i, (x, y, w, h) in enumerate(grid_boxes)
+                        if x <= hi_x and lo_x <= x + w and y <= hi_y and lo_y <= y + h]
+            assert index.query_rect(x0, y0, x1, y1) == expected
+    
+    def test_from_sprites_uses_sprite_index(self, extractor, sample_sprite_sheet_path):
+        """Test building the index from detected sprites"""
+        extractor.load_image(sample_sprite_sheet_path)
+        sprites = extractor.detect_sprites()
+        index = SpatialIndex.from_sprites(sprites)
+        
+        x, y, w, h = sprites[2].bbox
+        assert index.query_point(x + w // 2, y + h // 2) == [sprites[2].index]
+    
+    def test_empty_index(self):
+        """Test queries on an index without boxes"""
+        index = SpatialIndex([])
+        
+        assert len(index) == 0
+        assert index.query_point(0, 0) == []
+        assert index.query_rect(0, 0, 100, 100) == []